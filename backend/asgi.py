@@ -0,0 +1,311 @@
+"""
+ASGI serving mode:  uvicorn asgi:app --host 0.0.0.0 --port 5000   (or: python asgi.py)
+
+/ai and /ai/stream run on the event loop. The Flask-side parts of a turn (session load,
+parsing, cart update, history) are short hops to worker threads; the model call is awaited
+through the backend's async methods, so a slow model holds no thread and one process can keep hundreds of
+voice turns in flight. Every other route is the unchanged Flask app behind a small WSGI bridge.
+Sessions, cookies and CORS headers are handled by the Flask app exactly as under app.run.
+"""
+import asyncio
+import io
+import sys
+import time
+import traceback
+
+from flask import Response, jsonify, request, session
+
+import breaker
+import deadline
+import main
+import metrics
+from main import app as flask_app
+from streaming import SentenceChunker, sse
+
+
+def build_environ(scope, body: bytes) -> dict:
+    """WSGI environ for an ASGI http scope"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin1"), value.decode("latin1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_head(send, status: int, headers):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]})
+
+
+async def send_response(send, status: int, headers, body: bytes):
+    await send_head(send, status, headers)
+    await send({"type": "http.response.body", "body": body})
+
+
+def call_wsgi(environ):
+    """Run the Flask app for one request in a worker thread; returns (status, headers, body)"""
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split()[0]), headers]
+
+    result = flask_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return started[0], started[1], body
+
+
+# ----------------- /ai turn halves (worker threads) -----------------
+def begin_turn(environ, structured: bool = False):
+    """
+    Open the session and run the turn up to the model call. Returns (session, turn, error) —
+    error is a finished (status, headers, body) when the request is rejected.
+    """
+    ctx = flask_app.request_context(environ)
+    ctx.push()
+    try:
+        main.init_session()
+        data = request.get_json(silent=True) or {}
+        user_prompt = (data.get("user_prompt", "") or "").strip()
+        if not user_prompt:
+            response = jsonify({"success": False, "error": "user_prompt required"})
+            response.status_code = 400
+            return ctx.session, None, respond(response)
+        return ctx.session, main.start_turn(user_prompt, structured), None
+    except Exception as e:
+        traceback.print_exception(e)
+        response = jsonify({"success": False, "error": str(e)})
+        response.status_code = 500
+        return ctx.session, None, respond(response)
+    finally:
+        ctx.pop()
+
+
+def respond(response: Response):
+    """After-request hooks (CORS) and session save, inside an active request context"""
+    response = flask_app.process_response(response)
+    return response.status_code, list(response.headers.items()), response.get_data()
+
+
+def in_session(environ, sess, fn):
+    """Run fn() in a fresh request context bound to an already open session"""
+    ctx = flask_app.request_context(environ)
+    ctx.session = sess
+    ctx.push()
+    try:
+        return fn()
+    finally:
+        ctx.pop()
+
+
+def end_turn(environ, sess, turn, reply: str, source: str, actions=None):
+    def _finish():
+        return respond(jsonify(main.finish_turn(turn, reply, source, actions)))
+    return in_session(environ, sess, _finish)
+
+
+def error_response(environ, sess, e: Exception):
+    traceback.print_exception(e)
+
+    def _error():
+        response = jsonify({"success": False, "error": str(e)})
+        response.status_code = 500
+        return respond(response)
+    return in_session(environ, sess, _error)
+
+
+# ----------------- async handlers -----------------
+def new_deadline():
+    return deadline.Deadline(main.AI_DEADLINE_SECONDS, main.AI_DEADLINE_RESERVE)
+
+
+async def admit_model_call(turn_deadline) -> bool:
+    """Async main.admit_model_call"""
+    await main.model_limiter.acquire_async(turn_deadline.remaining())
+    try:
+        probe = main.model_breaker.acquire()
+    except breaker.BreakerOpen:
+        main.model_limiter.release()
+        raise
+    metrics.incr("model_calls")
+    return probe
+
+
+async def ask_model(turn, turn_deadline):
+    """Async main.ask_model: one awaited call per set of identical turns in flight; returns the raw output"""
+    generate = main.model.generate_structured_async if turn.structured else main.model.generate_async
+
+    async def _call():
+        probe = await admit_model_call(turn_deadline)
+        started, ok = time.monotonic(), False
+        try:
+            # wait_for cancels the call when the budget runs out
+            raw = await asyncio.wait_for(generate(turn.prompt_for_model), turn_deadline.remaining())
+            ok = True
+        finally:
+            main.model_limiter.release()
+            main.model_breaker.record(ok, time.monotonic() - started, probe)
+        return raw
+    return await main.model_flights.do_async(turn.flight_key, _call, timeout=turn_deadline.remaining())
+
+
+async def ai(scope, receive, send):
+    turn_deadline = new_deadline()
+    environ = build_environ(scope, await read_body(receive))
+    sess, turn, rejected = await asyncio.to_thread(begin_turn, environ, main.STRUCTURED_REPLIES)
+    if rejected:
+        return await send_response(send, *rejected)
+    try:
+        source = turn.source
+        reply = main.clean_text(turn.ai_text) if turn.ai_text is not None else None
+        actions = None
+        if turn.prompt_for_model is not None:
+            try:
+                reply, actions = main.model_reply(turn, await ask_model(turn, turn_deadline))
+            except Exception as e:
+                reply, source = turn.fallback, main.model_failed(e)
+        result = await asyncio.to_thread(end_turn, environ, sess, turn, reply, source, actions)
+    except Exception as e:
+        result = await asyncio.to_thread(error_response, environ, sess, e)
+    await send_response(send, *result)
+
+
+async def ai_stream(scope, receive, send):
+    """Event-loop version of /ai/stream; same events and deadline handling as the Flask route"""
+    turn_deadline = new_deadline()
+    environ = build_environ(scope, await read_body(receive))
+    sess, turn, rejected = await asyncio.to_thread(begin_turn, environ)
+    if rejected:
+        return await send_response(send, *rejected)
+    metrics.incr("stream_turns")
+
+    def _open():
+        # persists the user message and cart now and yields the cookie/CORS headers for the stream
+        status, headers, _ = respond(Response(mimetype="text/event-stream",
+                                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}))
+        return status, [(k, v) for k, v in headers if k.lower() != "content-length"], main.cart_summary()
+    status, headers, summary = await asyncio.to_thread(in_session, environ, sess, _open)
+    await send_head(send, status, headers)
+
+    async def push(event: str, data: dict):
+        await send({"type": "http.response.body", "body": sse(event, data).encode(), "more_body": True})
+
+    await push("cart", {"message": turn.cart_update_msg, "cart_summary": summary})
+    chunker = SentenceChunker(main.clean_text)
+    sent = []
+
+    async def emit(chunks):
+        for chunk in chunks:
+            if not sent:
+                metrics.set_gauge("stream_first_chunk_ms", turn_deadline.elapsed_ms())
+            sent.append(chunk)
+            await push("chunk", {"text": chunk})
+
+    source = turn.source
+    if turn.prompt_for_model is None:
+        await emit(chunker.feed(turn.ai_text))
+    else:
+        probe = started = first_piece = None
+        completed = failed = False
+        try:
+            probe = await admit_model_call(turn_deadline)
+            started = time.monotonic()
+            pieces = main.model.stream_async(turn.prompt_for_model)
+            while True:
+                # only the wait for the next piece is timed, never a send to the client
+                try:
+                    piece = await asyncio.wait_for(anext(pieces), turn_deadline.remaining())
+                except StopAsyncIteration:
+                    break
+                first_piece = first_piece or time.monotonic() - started
+                await emit(chunker.feed(piece))
+            completed = True
+            await emit(chunker.flush())
+            main.response_cache.put(turn.cache_key, " ".join(sent))
+        except Exception as e:
+            # a reply cut off at the deadline keeps what was already spoken
+            failed = True
+            source = main.model_failed(e)
+            chunker.discard()
+            if not sent:
+                await emit([turn.fallback])
+        finally:
+            if started is not None:
+                main.model_limiter.release()
+                # cancelled with nothing from the model yet (client hung up): no verdict
+                if completed or failed or first_piece:
+                    main.model_breaker.record(not failed, first_piece or time.monotonic() - started, probe)
+                else:
+                    main.model_breaker.release(time.monotonic() - started, probe)
+    await emit(chunker.flush())
+
+    def _close():
+        payload = main.finish_turn(turn, " ".join(sent), source)
+        flask_app.session_interface.save_session(flask_app, session, Response())
+        return {"response": payload["response"], "session_id": payload["session_id"]}
+    done = await asyncio.to_thread(in_session, environ, sess, _close)
+    await send({"type": "http.response.body", "body": sse("done", done).encode()})
+
+
+ASYNC_ROUTES = {("POST", "/ai"): ai, ("POST", "/ai/stream"): ai_stream}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    handler = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+    # the async paths need the async model client; without a model the turn never blocks anyway
+    if handler is not None and main.model is not None:
+        return await handler(scope, receive, send)
+    environ = build_environ(scope, await read_body(receive))
+    await send_response(send, *(await asyncio.to_thread(call_wsgi, environ)))
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("ASGI mode needs uvicorn: pip install uvicorn")
+    uvicorn.run("asgi:app", host="0.0.0.0", port=5000)
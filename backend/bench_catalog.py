@@ -0,0 +1,135 @@
+"""
+Catalog lookup benchmark: in-memory CatalogIndex vs SQLite/FTS5 backend.
+
+    python bench_catalog.py                 # 1k / 10k / 100k items
+    python bench_catalog.py --sizes 5000 --lookups 2000
+
+Each (backend, size) pair runs in its own subprocess so the RSS numbers aren't polluted
+by the previous run.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ADJECTIVES = ["fresh", "organic", "red", "green", "baby", "large", "small", "premium", "local", "frozen",
+              "sweet", "dried", "whole", "sliced", "farm", "wild", "golden", "spicy", "salted", "roasted"]
+NOUNS = ["apple", "banana", "tomato", "onion", "potato", "carrot", "mango", "grape", "cheese", "butter",
+         "rice", "lentil", "bean", "pepper", "almond", "cashew", "yogurt", "bread", "pasta", "cookie"]
+CATEGORIES = ["fruits", "vegetables", "dairy", "grains", "snacks", "other"]
+
+
+def make_catalog(size: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    catalog = {c: {} for c in CATEGORIES}
+    n = 0
+    while n < size:
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {n}"
+        catalog[CATEGORIES[n % len(CATEGORIES)]][name] = rng.randint(10, 500)
+        n += 1
+    return catalog
+
+
+def make_queries(catalog: dict, count: int, seed: int = 11):
+    rng = random.Random(seed)
+    names = [name for items in catalog.values() for name in items]
+    queries = []
+    for i in range(count):
+        name = rng.choice(names)
+        kind = i % 4
+        if kind == 0:
+            queries.append(name)                              # exact
+        elif kind == 1:
+            queries.append(name.replace(" ", "s ", 1) + "s")  # inflected
+        elif kind == 2:
+            queries.append(f"2 kg {name} please")             # embedded in an utterance
+        else:
+            queries.append(f"unknown item {i}")               # miss
+    return queries
+
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_worker(backend: str, size: int, lookups: int, workdir: str):
+    from catalog import CatalogIndex
+    from catalog_sqlite import SqliteCatalog, import_catalog
+
+    catalog = make_catalog(size)
+    queries = make_queries(catalog, lookups)
+    json_path = os.path.join(workdir, f"prices-{size}.json")
+    with open(json_path, "w") as fh:
+        json.dump(catalog, fh)
+    del catalog
+
+    base = rss_kb()
+    started = time.perf_counter()
+    if backend == "memory":
+        with open(json_path) as fh:
+            index = CatalogIndex(json.load(fh))
+    else:
+        db_path = os.path.join(workdir, f"catalog-{size}.db")
+        import_catalog(json_path, db_path)
+        index = SqliteCatalog(db_path)
+    load_s = time.perf_counter() - started
+    index.lookup(queries[0])
+
+    timings = []
+    for q in queries:
+        t0 = time.perf_counter()
+        index.lookup(q)
+        timings.append(time.perf_counter() - t0)
+    timings.sort()
+    print(json.dumps({
+        "backend": backend,
+        "size": size,
+        "load_s": round(load_s, 3),
+        "rss_mb": round((rss_kb() - base) / 1024, 1),
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 1),
+        "p99_us": round(timings[int(len(timings) * 0.99)] * 1e6, 1),
+        "mean_us": round(sum(timings) / len(timings) * 1e6, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--worker", nargs=2, metavar=("BACKEND", "SIZE"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]), args.lookups, args.workdir)
+        return
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'backend':<8} {'items':>8} {'load s':>8} {'RSS MB':>8} {'p50 us':>8} {'p99 us':>8} {'mean us':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            for backend in ("memory", "sqlite"):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", backend, str(size),
+                     "--lookups", str(args.lookups), "--workdir", workdir],
+                    cwd=here, capture_output=True, text=True, check=True,
+                ).stdout.strip().splitlines()[-1]
+                r = json.loads(out)
+                print(f"{r['backend']:<8} {r['size']:>8} {r['load_s']:>8} {r['rss_mb']:>8} "
+                      f"{r['p50_us']:>8} {r['p99_us']:>8} {r['mean_us']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: the old sequential regex intent/extraction path vs nlu.analyze.
+
+    python bench_nlu.py
+    python bench_nlu.py --repeat 50
+
+The legacy patterns are copied here verbatim so the comparison stays meaningful after they
+were removed from main.py.
+"""
+import argparse
+import json
+import re
+import time
+
+from catalog import CatalogIndex
+import nlu
+
+LEGACY_CART_QUERY_PATTERNS = [
+    r'what.*in.*my.*cart',
+    r'what.*in.*the.*cart',
+    r'what.*are.*in.*my.*cart',
+    r'what.*items.*in.*my.*cart',
+    r'list.*cart',
+    r'show.*cart'
+]
+LEGACY_EXTRACT_PATTERNS = [
+    r'(\d+)\s*(?:kg|kilos?|kilograms?|g|grams?)?\s+(?:of\s+)?([a-zA-Z]+)',
+    r'add\s+(\d+)?\s*([a-zA-Z]+)\s+to',
+    r'order\s+(\d+)?\s*([a-zA-Z]+)',
+    r'i want\s+(\d+)?\s*([a-zA-Z]+)',
+    r'(\d+)\s*([a-zA-Z]+)(?:\s+please)?'
+]
+
+
+def legacy(user_prompt: str):
+    user_lower = user_prompt.lower()
+    is_cart_query = any(re.search(pat, user_lower) for pat in LEGACY_CART_QUERY_PATTERNS)
+    found = None
+    # the old code ran extraction twice on the price path
+    for _ in range(2):
+        for pattern in LEGACY_EXTRACT_PATTERNS:
+            match = re.search(pattern, user_lower)
+            if match:
+                found = match.groups()
+                break
+    return is_cart_query, found
+
+
+def inputs():
+    return {
+        "short command": "add 2 kg apples to my cart please",
+        "cart question": "what is in my cart right now",
+        "shopping list x50": ", ".join(f"{i % 9 + 1} kg tomatoes" for i in range(50)),
+        # many 'what'/'in'/'my' and never 'cart': each .* gap backtracks over the rest
+        "what-in-my no cart": "what is in my bag " * 150,
+        "list without cart": "list " * 800,
+        "digits no letters": "1 " * 1500,
+    }
+
+
+def timed(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with open("grocery_prices.json") as fh:
+        index = CatalogIndex(json.load(fh))
+
+    print(f"{'input':<22} {'chars':>6} {'legacy ms':>10} {'nlu ms':>8}")
+    for label, text in inputs().items():
+        old = timed(legacy, text, args.repeat)
+        new = timed(lambda t: nlu.analyze(t, index), text, args.repeat)
+        print(f"{label:<22} {len(text):>6} {old * 1000:>10.3f} {new * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
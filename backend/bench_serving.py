@@ -0,0 +1,182 @@
+"""
+Load test: threaded app.run server vs the ASGI mode (asgi.py under uvicorn).
+
+    python bench_serving.py
+    python bench_serving.py --concurrency 50 200 500 --requests 1000 --latency fixed:800
+    python bench_serving.py --latency lognormal:700:0.5 --error-rate 0.02 --seed 7
+
+Each server runs in its own subprocess and scratch directory with the fake model backend
+(MODEL_BACKEND=fake), which waits out the --latency distribution per call (time.sleep on the
+threaded server, asyncio.sleep under ASGI), so the numbers show how many slow model turns one
+process can hold, not Gemini itself.
+Every virtual user keeps its own session cookie; the response cache is off so each turn
+reaches the model. Reports throughput, latency percentiles and the server's peak threads and RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ----------------- server side -----------------
+def serve(mode: str, port: int):
+    # the model settings come from the parent through FAKE_MODEL_* in the environment
+    os.environ.update(MODEL_BACKEND="fake", RESPONSE_CACHE_SIZE="0", RESPONSE_CACHE_WARM="0",
+                      CATALOG_RELOAD_INTERVAL="0", COALESCE_WAIT_SECONDS="0", AI_DEADLINE_SECONDS="0",
+                      MODEL_MAX_IN_FLIGHT="0")
+    sys.path.insert(0, HERE)
+    import main
+    if mode == "threaded":
+        main.app.run(host="127.0.0.1", port=port, threaded=True)
+    else:
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+# ----------------- client side -----------------
+async def request(port: int, path: str, body: dict, cookie: str):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode()
+    head = (f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n")
+    if cookie:
+        head += f"Cookie: {cookie}\r\n"
+    writer.write(head.encode() + b"\r\n" + payload)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    header, _, _ = raw.partition(b"\r\n\r\n")
+    lines = header.decode("latin1").split("\r\n")
+    status = int(lines[0].split()[1])
+    for line in lines[1:]:
+        if line.lower().startswith("set-cookie:"):
+            cookie = line.split(":", 1)[1].split(";", 1)[0].strip()
+    return status, cookie
+
+
+async def load(port: int, concurrency: int, total: int):
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def user(uid: int):
+        nonlocal errors
+        cookie = ""
+        for i in remaining:
+            started = time.perf_counter()
+            try:
+                status, cookie = await request(port, "/ai", {"user_prompt": f"tell me something fun about vegetables {uid} {i}"},
+                                               cookie)
+                if status != 200:
+                    errors += 1
+            except OSError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies), errors
+
+
+def proc_stats(pid: int):
+    stats = {}
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                key, _, value = line.partition(":")
+                stats[key] = value.strip()
+    except OSError:
+        pass
+    return int(stats.get("Threads", "0")), int(stats.get("VmHWM", "0 kB").split()[0]) / 1024
+
+
+def wait_for(port: int, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run(mode: str, concurrency: int, total: int, model_env: dict):
+    workdir = tempfile.mkdtemp(prefix="bench_serving_")
+    for name in ("grocery_prices.json", "item_aliases.json"):
+        if os.path.exists(os.path.join(HERE, name)):
+            shutil.copy(os.path.join(HERE, name), workdir)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port)],
+        cwd=workdir, env={**os.environ, **model_env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    peak_threads = 0
+    stop = threading.Event()
+
+    def sample():
+        nonlocal peak_threads
+        while not stop.is_set():
+            peak_threads = max(peak_threads, proc_stats(server.pid)[0])
+            time.sleep(0.05)
+
+    try:
+        wait_for(port)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        elapsed, latencies, errors = asyncio.run(load(port, concurrency, total))
+        stop.set()
+        sampler.join()
+        _, rss = proc_stats(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    print(f"{mode:<9} {concurrency:>5} {total / elapsed:>8.1f} {pct(0.5):>8.0f} {pct(0.99):>8.0f} "
+          f"{errors:>6} {peak_threads:>8} {rss:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--latency", default="fixed:500", help="fake model latency distribution in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", default=["threaded", "asgi"])
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+    model_env = {"FAKE_MODEL_LATENCY": args.latency, "FAKE_MODEL_ERROR_RATE": str(args.error_rate),
+                 "FAKE_MODEL_SEED": str(args.seed)}
+    print(f"model latency {args.latency} ms, error rate {args.error_rate}, {args.requests} requests per run")
+    print(f"{'server':<9} {'users':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6} {'threads':>8} {'RSS MB':>7}")
+    for concurrency in args.concurrency:
+        for mode in args.modes:
+            run(mode, concurrency, args.requests, model_env)
+
+
+if __name__ == "__main__":
+    main()
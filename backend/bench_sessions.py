@@ -0,0 +1,98 @@
+"""
+Session store benchmark: Flask-Session filesystem (pickle file per session) vs the SQLite store.
+
+    python bench_sessions.py
+    python bench_sessions.py --workers 1 4 8 --sessions 500 --requests 3000 --write-share 0.3
+
+For each backend and worker count, that many processes run the app in-process (Flask test
+client, no network) against one shared scratch directory, so they contend on the same session
+files or database as real workers would. Each worker opens --sessions sessions first, then
+starts with the others and replays GET /cart and POST /cart/add (--write-share of requests)
+across them in random order. Reports total requests/sec and per-request latency percentiles.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ITEMS = ["apple", "banana", "tomato", "onion", "milk", "rice"]
+
+
+def run_worker(backend: str, sessions: int, requests: int, write_share: float, start_at: float, seed: int):
+    os.environ.update(SESSION_BACKEND=backend, MODEL_BACKEND="none", RESPONSE_CACHE_WARM="0",
+                      CATALOG_RELOAD_INTERVAL="0")
+    sys.path.insert(0, HERE)
+    out = sys.stdout
+    # the routes log every request; keep that out of the numbers
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import main
+        clients = [main.app.test_client() for _ in range(sessions)]
+        for client in clients:
+            client.get("/cart")
+        rng = random.Random(seed)
+        time.sleep(max(0.0, start_at - time.time()))
+
+        timings = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            client = rng.choice(clients)
+            t0 = time.perf_counter()
+            if rng.random() < write_share:
+                client.post("/cart/add", json={"item_name": rng.choice(ITEMS), "quantity": 1})
+            else:
+                client.get("/cart")
+            timings.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+    print(json.dumps({"elapsed": elapsed, "timings": timings}), file=out)
+
+
+def pct(timings, p):
+    return round(timings[min(len(timings) - 1, int(len(timings) * p))] * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["filesystem", "sqlite"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--sessions", type=int, default=200, help="sessions per worker")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per worker")
+    parser.add_argument("--write-share", type=float, default=0.2)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--seed", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.sessions, args.requests, args.write_share, args.start_at, args.seed)
+        return
+
+    print(f"{'backend':<11} {'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for backend in args.backends:
+        for workers in args.workers:
+            workdir = tempfile.mkdtemp(prefix="bench_sessions_")
+            for name in ("grocery_prices.json", "item_aliases.json"):
+                if os.path.exists(os.path.join(HERE, name)):
+                    shutil.copy(os.path.join(HERE, name), workdir)
+            # room for the setup phase: importing the app and opening every session
+            start_at = time.time() + 3 + args.sessions * workers / 500
+            procs = [subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker", backend, "--sessions", str(args.sessions),
+                 "--requests", str(args.requests), "--write-share", str(args.write_share),
+                 "--start-at", str(start_at), "--seed", str(w)],
+                cwd=workdir, stdout=subprocess.PIPE, text=True) for w in range(workers)]
+            results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+            shutil.rmtree(workdir, ignore_errors=True)
+            timings = sorted(t for r in results for t in r["timings"])
+            rate = len(timings) / max(r["elapsed"] for r in results)
+            print(f"{backend:<11} {workers:>7} {rate:>9.0f} {pct(timings, 0.5):>8} {pct(timings, 0.99):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Circuit breaker around the model.
+
+Closed: calls go through and their outcomes fill a rolling window of the last `window` calls.
+A call counts as failed when it raises, misses the turn deadline or takes longer than
+slow_seconds. Once at least min_calls are in the window and the failed share reaches
+failure_rate, the breaker opens.
+
+Open: calls fail fast with BreakerOpen (the turn is answered locally) for open_seconds.
+
+Half-open: after that, one probe call at a time is let through. A good probe closes the
+breaker with an empty window; a failed one opens it again.
+
+A call whose client went away before the model answered says nothing about the model: release()
+frees the probe slot without a verdict, unless the call had already run past slow_seconds.
+"""
+import threading
+import time
+from collections import deque
+
+import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class BreakerOpen(Exception):
+    """The model is considered down: answer locally without calling it"""
+
+
+class CircuitBreaker:
+    def __init__(self, window: int = 20, min_calls: int = 10, failure_rate: float = 0.5,
+                 slow_seconds: float = 0.0, open_seconds: float = 15.0):
+        # window <= 0 disables the breaker; slow_seconds <= 0 means latency alone never counts as failure
+        self.window = window
+        self.min_calls = min(min_calls, window) if window > 0 else 0
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=max(window, 1))   # True = failed
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def _set_state(self, state: str):
+        # caller holds the lock
+        self.state = state
+        metrics.set_gauge("breaker_state", _STATE_GAUGE[state])
+
+    def _open(self, why: str):
+        self._set_state(OPEN)
+        self._opened_at = time.monotonic()
+        self._probing = False
+        metrics.incr("breaker_opened")
+        print(f"🔴 Model circuit open ({why}) — answering locally for {self.open_seconds:g}s")
+
+    def _refresh(self):
+        # caller holds the lock; open -> half-open once the wait is over
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+
+    def is_open(self) -> bool:
+        """True while calls would be refused (a half-open breaker with a probe out counts as open)"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._refresh()
+            return self.state == OPEN or (self.state == HALF_OPEN and self._probing)
+
+    def acquire(self) -> bool:
+        """Permission for one call; returns True if it is the half-open probe. Raises BreakerOpen."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._refresh()
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                metrics.incr("breaker_probes")
+                return True
+        metrics.incr("breaker_fast_fails")
+        raise BreakerOpen("model circuit open")
+
+    def record(self, ok: bool, seconds: float, probe: bool = False):
+        """Outcome of a call let through by acquire()"""
+        if not self.enabled:
+            return
+        failed = not ok or (self.slow_seconds > 0 and seconds > self.slow_seconds)
+        with self._lock:
+            if probe:
+                self._probing = False
+                if failed:
+                    self._open("probe failed")
+                else:
+                    self._outcomes.clear()
+                    self._set_state(CLOSED)
+                    print("🟢 Model circuit closed — probe succeeded")
+                return
+            if self.state != CLOSED:
+                return   # a call from before the breaker opened; only the probe decides now
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(f"{failures}/{len(self._outcomes)} recent calls failed or slow")
+
+    def release(self, seconds: float, probe: bool = False):
+        """End of a call abandoned by its client before any answer: no verdict unless it was already slow"""
+        if not self.enabled:
+            return
+        if self.slow_seconds > 0 and seconds > self.slow_seconds:
+            self.record(False, seconds, probe)
+            return
+        metrics.incr("breaker_calls_abandoned")
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    def status(self) -> dict:
+        with self._lock:
+            self._refresh()
+            failures = sum(self._outcomes)
+            retry_in = self.open_seconds - (time.monotonic() - self._opened_at) if self.state == OPEN else 0
+            return {
+                "enabled": self.enabled,
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": failures,
+                "failure_rate": round(failures / len(self._outcomes), 4) if self._outcomes else None,
+                "probe_in_flight": self._probing,
+                "retry_in_seconds": round(max(0.0, retry_in), 1),
+            }
@@ -0,0 +1,122 @@
+"""
+Structured model replies: the text to speak plus the cart actions it implies, in one call.
+
+The model answers through the `respond` function (Gemini function calling) or, for backends
+without it, with the same object as JSON text:
+    {"reply": "...", "actions": [{"op": "add", "item": "apple", "quantity": 2, "unit": "kg"}, ...]}
+Actions are checked against the catalog before anything touches the cart: unknown items,
+unknown ops and impossible amounts are dropped and reported back to the user.
+"""
+import json
+import re
+from typing import NamedTuple
+
+from quantities import UNITS, pricing_unit, to_pricing_unit
+
+OPS = ("add", "remove", "set", "query")
+# at most this many actions are taken from one reply
+MAX_ACTIONS = 10
+# largest amount one action may put on a line, in the item's pricing unit
+MAX_QUANTITY = 100
+
+# Gemini function declaration (google.ai.generativelanguage Tool, as a dict)
+RESPOND_TOOL = {
+    "function_declarations": [{
+        "name": "respond",
+        "description": "Answer the shopper and list the cart changes they asked for.",
+        "parameters": {
+            "type_": "OBJECT",
+            "properties": {
+                "reply": {"type_": "STRING", "description": "Short spoken answer, without repeating cart changes."},
+                "actions": {
+                    "type_": "ARRAY",
+                    "items": {
+                        "type_": "OBJECT",
+                        "properties": {
+                            "op": {"type_": "STRING", "enum": list(OPS)},
+                            "item": {"type_": "STRING", "description": "Item name from the price list."},
+                            "quantity": {"type_": "NUMBER"},
+                            "unit": {"type_": "STRING", "enum": ["kg", "g", "l", "ml", "dozen", "piece"]},
+                        },
+                        "required": ["op", "item"],
+                    },
+                },
+            },
+            "required": ["reply"],
+        },
+    }],
+}
+
+PROMPT_INSTRUCTIONS = """Answer by calling respond, or with only this JSON object:
+{"reply": "<short answer>", "actions": [{"op": "add|remove|set|query", "item": "<name from the price list>", "quantity": <number>, "unit": "kg|g|l|ml|dozen|piece"}]}
+add/remove/set change the cart (set = new total amount); query = the user only asked about the item.
+List only changes the user asked for in this message. The app announces cart changes itself, so don't repeat them in reply."""
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class Action(NamedTuple):
+    op: str          # add / remove / set / query
+    item: str        # canonical catalog name
+    quantity: float  # in the item's pricing unit; None for remove and query
+
+
+def parse_reply(raw):
+    """
+    Model output -> (reply, raw_actions). raw is the respond() arguments (a dict) or the reply
+    text; text that isn't the JSON object is taken as a plain reply with no actions.
+    """
+    if isinstance(raw, str):
+        text = _FENCE_RE.sub("", raw.strip())
+        try:
+            raw = json.loads(text)
+        except ValueError:
+            return raw, []
+        if not isinstance(raw, dict):
+            return text, []
+    actions = raw.get("actions") or []
+    return str(raw.get("reply") or ""), actions if isinstance(actions, list) else []
+
+
+def validate(raw_actions, index):
+    """
+    Check model actions against the catalog. Returns (actions, rejected) where rejected holds
+    the item names (or ops) that couldn't be used.
+    """
+    actions, rejected = [], []
+    for raw in raw_actions[:MAX_ACTIONS]:
+        if not isinstance(raw, dict):
+            continue
+        op, named = str(raw.get("op", "")).lower(), str(raw.get("item", "")).strip()
+        if op not in OPS or not named:
+            rejected.append(named or op)
+            continue
+        name = index.resolve(named)
+        if not name:
+            rejected.append(named)
+            continue
+        quantity = None
+        if op in ("add", "set"):
+            quantity = _quantity(raw.get("quantity", 1), raw.get("unit"), name)
+            # set to 0 is a remove; anything else unusable is rejected
+            if quantity == 0 and op == "set":
+                op, quantity = "remove", None
+            elif quantity is None or quantity <= 0:
+                rejected.append(named)
+                continue
+        actions.append(Action(op, name, quantity))
+    return actions, rejected
+
+
+def _quantity(value, unit, name: str):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if value < 0:
+        return None
+    unit = str(unit).lower() if unit else pricing_unit(name)
+    if unit not in UNITS:
+        return None
+    quantity = to_pricing_unit(value, unit, name)
+    return quantity if quantity is not None and quantity <= MAX_QUANTITY else None
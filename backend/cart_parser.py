@@ -0,0 +1,67 @@
+"""Pull every (item, quantity, unit) mentioned in one utterance"""
+from typing import NamedTuple
+
+from fuzzy import STOPWORDS
+import metrics
+from nlu import FILLER_WORDS, has_cue, unknown_item_word
+from quantities import pricing_unit, to_pricing_unit
+
+
+class ParsedItem(NamedTuple):
+    item: str       # canonical catalog name
+    quantity: float # in the item's pricing unit
+    unit: str       # the item's pricing unit ("kg", "l", "dozen")
+    text: str       # the segment it came from
+
+
+def parse_items(analysis, index):
+    """
+    Turn the list segments of an nlu.Analysis into cart items ("2 kg apples, 1 kg onions and milk").
+    Segments without an exact catalog name get one fuzzy attempt ("bananna"), but only when the
+    segment itself is an order (an amount, or "add"/"buy"/"I want"...): a near-miss in "and tell me
+    which is better" must not land in the cart. The same item
+    mentioned twice is merged: spoken amounts add up, a bare re-mention ("2 kg apples and tell
+    me why apples are healthy") adds nothing. Returns (items, unmatched) where unmatched lists segments that
+    carried a quantity but no catalog item ("3 dragonfruit" -> "dragonfruit").
+    Spoken amounts are converted to the item's pricing unit ("500 g" -> 0.5 kg, "a dozen eggs" -> 1 dozen).
+    """
+    found = {}
+    explicit = set()   # items whose amount was spoken rather than defaulted to 1
+    unmatched = []
+    for segment in analysis.segments:
+        names = list(segment.items)
+        if not names and (segment.quantity is not None or has_cue(segment, "order")):
+            candidates = " ".join(w for w in segment.words if w not in FILLER_WORDS and w not in STOPWORDS)
+            name = index.spot(candidates)[0] if candidates else None
+            if name:
+                names = [name]
+            elif segment.quantity is not None:
+                word = unknown_item_word(segment)
+                if word:
+                    unmatched.append(word)
+        for name in names:
+            quantity = segment_quantity(segment, name)
+            spoken = segment.quantity is not None
+            if name in found:
+                if not spoken:
+                    continue
+                prev = found[name]
+                total = prev.quantity + quantity if name in explicit else quantity
+                found[name] = prev._replace(quantity=round(total, 3))
+            else:
+                found[name] = ParsedItem(name, quantity, pricing_unit(name), " ".join(segment.words))
+            if spoken:
+                explicit.add(name)
+    return list(found.values()), unmatched
+
+
+def segment_quantity(segment, name: str):
+    """Segment amount in the pricing unit of `name`; 1 when none was spoken"""
+    if segment.quantity is None:
+        return 1
+    quantity = to_pricing_unit(segment.quantity, segment.unit, name)
+    if quantity is None:
+        # units that can't be related (pieces of rice): keep the number, as before units were read
+        metrics.incr("quantity_unit_mismatches")
+        return segment.quantity
+    return quantity
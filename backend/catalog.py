@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from fuzzy import FuzzyMatcher
+from spotter import PhraseSpotter
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase and collapse whitespace so lookups are case/spacing insensitive"""
+    return " ".join(_TOKEN_RE.findall((name or "").lower()))
+
+
+def _word_forms(word: str):
+    """Return plural/singular variants of a single word ("tomato" -> "tomatoes", "berries" -> "berry")"""
+    forms = set()
+    if len(word) < 3:
+        return forms
+    if not word.endswith("s"):
+        # singular -> plural
+        if word.endswith("y") and word[-2] not in "aeiou":
+            forms.add(word[:-1] + "ies")
+        elif word.endswith(("x", "z", "ch", "sh", "o")):
+            forms.add(word + "es")
+        forms.add(word + "s")
+    elif not word.endswith("ss"):
+        # plural -> singular
+        if word.endswith("ies"):
+            forms.add(word[:-3] + "y")
+        elif word.endswith(("oes", "xes", "zes", "ches", "shes")):
+            forms.add(word[:-2])
+        forms.add(word[:-1])
+    return forms
+
+
+def name_variants(name: str):
+    """Variants of a (possibly multi-word) name; only the last word is inflected"""
+    words = name.split()
+    if not words:
+        return set()
+    head = words[:-1]
+    return {" ".join(head + [form]) for form in _word_forms(words[-1])}
+
+
+def _specificity(name):
+    # prefer the shortest (most specific) name, alphabetical for determinism
+    return len(name.split()), name
+
+
+class CatalogIndex:
+    """
+    Flat lookup structures compiled once from the nested {category: {item: price}} dict.
+
+    - items:   canonical name -> (price, category)
+    - aliases: any accepted spelling (canonical, plural/singular) -> canonical name
+    - tokens:  single word -> canonical names containing that word (for partial matches)
+    - spotter: Aho-Corasick automaton over all aliases, finds every mention in one pass
+    - fuzzy:   trigram + phonetic matcher over all aliases, last resort for misheard names
+
+    Every lookup is a handful of dict probes, so cost does not grow with catalog size.
+    """
+
+    def __init__(self, prices: dict, extra_aliases: dict = None, fuzzy_threshold: float = 0.8, previous=None):
+        # previous: the index this one replaces; its spotter is reused when the alias set is unchanged
+        self.items = {}
+        self.aliases = {}
+        self.tokens = {}
+        self.categories = {}
+        self.max_words = 1
+        for category, entries in (prices or {}).items():
+            for raw_name, price in (entries or {}).items():
+                name = normalize_name(raw_name)
+                if not name or name in self.items:
+                    continue
+                self.items[name] = (price, category)
+                self.categories.setdefault(category, []).append(name)
+                self.max_words = max(self.max_words, len(name.split()))
+        # canonical names always win over generated variants
+        for name in self.items:
+            self.aliases[name] = name
+        for name in self.items:
+            for variant in name_variants(name):
+                self.aliases.setdefault(variant, name)
+        for alias, target in (extra_aliases or {}).items():
+            alias, target = normalize_name(alias), normalize_name(target)
+            if alias and target in self.items:
+                self.aliases.setdefault(alias, target)
+                self.max_words = max(self.max_words, len(alias.split()))
+        for alias, name in self.aliases.items():
+            for tok in alias.split():
+                self.tokens.setdefault(tok, set()).add(name)
+        # best single-word partial match, precomputed so common words don't cost a scan per lookup
+        self.token_best = {tok: min(names, key=_specificity) for tok, names in self.tokens.items()}
+        self.fuzzy = FuzzyMatcher(self.aliases, threshold=fuzzy_threshold)
+        old = getattr(previous, "spotter", None)
+        self.spotter = old.updated(self.aliases) if old is not None else PhraseSpotter(self.aliases)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def resolve(self, item_name: str, fuzzy: bool = True):
+        """Map a spoken/typed item name to its canonical catalog name, or None"""
+        query = normalize_name(item_name)
+        if not query:
+            return None
+        hit = self.aliases.get(query)
+        if hit:
+            return hit
+        words = query.split()
+        # longest run of consecutive words that is a known name ("2 kg basmati rice please")
+        found = self.spotter.longest_by_start(words)
+        if found:
+            start = max(found, key=lambda s: (found[s][0], -s))
+            return found[start][1]
+        hit = self._partial(words)
+        if hit is None and fuzzy:
+            hit, _ = self.fuzzy.spot(query)
+        return hit
+
+    def _partial(self, words):
+        """Token-boundary partial match: names that contain whole query words ("basmati" -> "basmati rice")"""
+        known = sorted((w for w in words if w in self.tokens), key=lambda w: len(self.tokens[w]))
+        if not known:
+            return None
+        candidates = self.tokens[known[0]]
+        narrowed = False
+        for w in known[1:]:
+            both = candidates & self.tokens[w]
+            if both:
+                candidates, narrowed = both, True
+        if not narrowed:
+            return self.token_best[known[0]]
+        return min(candidates, key=_specificity)
+
+    def lookup(self, item_name: str):
+        """Return (price, category) for an item name, or (None, None)"""
+        name = self.resolve(item_name)
+        if name is None:
+            return None, None
+        return self.items[name]
+
+    def alias(self, phrase: str):
+        """Canonical name for an exact (already normalized) name or alias, or None"""
+        return self.aliases.get(phrase)
+
+    def mentions(self, tokens) -> dict:
+        """{token index: (length, canonical name)} for the longest alias starting at each token"""
+        return self.spotter.longest_by_start(tokens)
+
+    def get(self, name: str):
+        """(price, category) for an already canonical name, or (None, None)"""
+        return self.items.get(name, (None, None))
+
+    def category_names(self):
+        return list(self.categories)
+
+    def category_items(self, category: str, limit: int = 20):
+        """Rows (name, price, category) from one category"""
+        return [(name,) + self.items[name] for name in self.categories.get(category, [])[:limit]]
+
+    def search(self, text: str, limit: int = 20):
+        """Rows (name, price, category) whose name or alias shares a whole word with text"""
+        names = {}
+        for word in normalize_name(text).split():
+            for name in self.tokens.get(word, ()):
+                names[name] = names.get(name, 0) + 1
+        ranked = sorted(names, key=lambda n: (-names[n], len(n.split()), n))[:limit]
+        return [(name,) + self.items[name] for name in ranked]
+
+    def spot(self, text: str, threshold: float = None):
+        """Best fuzzy item mention among the words of an utterance"""
+        return self.fuzzy.spot(text, threshold=threshold)
+
+
+class CatalogSnapshot(NamedTuple):
+    """One immutable, fully built catalog; swapped in as a whole so readers never see a mix"""
+    version: str
+    prices: dict
+    index: CatalogIndex
+    loaded_at: str
+
+
+class CatalogStore:
+    """
+    Owns the active CatalogSnapshot for a prices file.
+
+    Readers grab `store.current` once per request and use only that object; a reload
+    builds a complete new snapshot off to the side and publishes it with a single
+    attribute assignment, which is atomic in CPython, so no locks are needed on the read path.
+    """
+
+    def __init__(self, path: str, backend: str = "memory", aliases_path: str = None, **index_kwargs):
+        # backend "memory": path is a prices JSON file compiled into a CatalogIndex
+        # backend "sqlite": path is a database built by `python catalog_sqlite.py import`
+        # aliases_path: optional {"alias": "catalog name"} JSON (regional names); watched like the
+        # prices file. The sqlite backend takes its aliases at import time instead.
+        self.path = path
+        self.backend = backend
+        self.aliases_path = aliases_path if backend == "memory" else None
+        self.index_kwargs = index_kwargs
+        self._reload_lock = threading.Lock()
+        self._signature = None
+        self._watcher = None
+        self.reload_count = 0
+        self.current = None
+        self.reload(force=True)
+
+    def _stat_signature(self):
+        st = os.stat(self.path)
+        signature = (st.st_mtime_ns, st.st_size)
+        if self.aliases_path and os.path.exists(self.aliases_path):
+            st = os.stat(self.aliases_path)
+            signature += (st.st_mtime_ns, st.st_size)
+        return signature
+
+    def _read_aliases(self):
+        if not self.aliases_path or not os.path.exists(self.aliases_path):
+            return b"", {}
+        with open(self.aliases_path, "rb") as fh:
+            raw = fh.read()
+        return raw, json.loads(raw)
+
+    def _build(self):
+        if self.backend == "sqlite":
+            from catalog_sqlite import SqliteCatalog
+            index = SqliteCatalog(self.path, **self.index_kwargs)
+            # prices stay on disk; callers use index.search() for the rows they need
+            return CatalogSnapshot(version=index.version, prices={}, index=index,
+                                   loaded_at=datetime.now().isoformat())
+        with open(self.path, "rb") as fh:
+            raw = fh.read()
+        prices = json.loads(raw)
+        alias_raw, aliases = self._read_aliases()
+        digest = hashlib.sha1(raw + alias_raw).hexdigest()[:12]
+        kwargs = dict(self.index_kwargs)
+        kwargs["extra_aliases"] = {**aliases, **(kwargs.get("extra_aliases") or {})}
+        previous = self.current.index if self.current is not None else None
+        return CatalogSnapshot(
+            version=digest,
+            prices=prices,
+            index=CatalogIndex(prices, previous=previous, **kwargs),
+            loaded_at=datetime.now().isoformat(),
+        )
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild and swap in a new snapshot if the file changed; returns True when swapped"""
+        with self._reload_lock:
+            try:
+                signature = self._stat_signature()
+            except OSError as e:
+                print(f"⚠️ Catalog file unavailable ({e}) — keeping version {self.current and self.current.version}")
+                return False
+            if not force and signature == self._signature:
+                return False
+            # remember the signature even on failure so a broken file isn't re-parsed every poll
+            self._signature = signature
+            try:
+                snapshot = self._build()
+            except (OSError, ValueError, sqlite3.Error) as e:
+                print(f"⚠️ Catalog reload failed ({e}) — keeping version {self.current and self.current.version}")
+                return False
+            if self.current is not None and snapshot.version == self.current.version:
+                return False
+            if self.current is not None:
+                self.reload_count += 1
+            self.current = snapshot
+            print(f"📇 Catalog version {snapshot.version} active: {len(snapshot.index)} items")
+            return True
+
+    def start_watching(self, interval: float = 2.0):
+        """Poll the file's mtime/size in a daemon thread and hot-swap on change"""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Catalog watcher error: {e}")
+
+        self._watcher = threading.Thread(target=_loop, name="catalog-watcher", daemon=True)
+        self._watcher.start()
@@ -0,0 +1,254 @@
+"""
+SQLite/FTS5 catalog backend for assortments too large to keep (and paste) in memory.
+
+Build the database from a prices JSON file:
+    python catalog_sqlite.py import grocery_prices.json catalog.db
+
+Then run the API with CATALOG_BACKEND=sqlite (and CATALOG_DB_PATH=catalog.db).
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from catalog import name_variants, normalize_name
+from fuzzy import STOPWORDS, is_common_word, similarity, trigrams
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, price NUMERIC NOT NULL, category TEXT NOT NULL);
+CREATE INDEX items_category ON items (category);
+CREATE TABLE aliases (alias TEXT PRIMARY KEY, item_id INTEGER NOT NULL) WITHOUT ROWID;
+-- word-level search over names, aliases and categories (partial match on whole words)
+CREATE VIRTUAL TABLE items_fts USING fts5(name, aliases, category);
+-- character trigrams of every alias, candidate source for misheard names
+CREATE VIRTUAL TABLE terms_trigram USING fts5(term, item_id UNINDEXED, tokenize='trigram');
+"""
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def import_catalog(json_path: str, db_path: str, extra_aliases: dict = None) -> str:
+    """Build db_path from a {category: {item: price}} JSON file; returns the catalog version"""
+    with open(json_path, "rb") as fh:
+        raw = fh.read()
+    prices = json.loads(raw)
+    # aliases are part of the version, as in the in-memory backend: changing them alone must reload
+    digest = hashlib.sha1(raw)
+    if extra_aliases:
+        digest.update(json.dumps(extra_aliases, sort_keys=True).encode())
+    version = digest.hexdigest()[:12]
+
+    # build next to the target and swap in, so running readers keep a consistent file
+    tmp_path = f"{db_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        names = {}
+        for category, entries in prices.items():
+            for raw_name, price in (entries or {}).items():
+                name = normalize_name(raw_name)
+                if not name or name in names:
+                    continue
+                cur = conn.execute("INSERT INTO items (name, price, category) VALUES (?, ?, ?)", (name, price, category))
+                names[name] = cur.lastrowid
+        alias_rows = {name: item_id for name, item_id in names.items()}
+        for name, item_id in names.items():
+            for variant in name_variants(name):
+                alias_rows.setdefault(variant, item_id)
+        for alias, target in (extra_aliases or {}).items():
+            alias, target = normalize_name(alias), normalize_name(target)
+            if alias and target in names:
+                alias_rows.setdefault(alias, names[target])
+        conn.executemany("INSERT INTO aliases (alias, item_id) VALUES (?, ?)", alias_rows.items())
+
+        per_item = {}
+        for alias, item_id in alias_rows.items():
+            per_item.setdefault(item_id, []).append(alias)
+        conn.executemany(
+            "INSERT INTO items_fts (rowid, name, aliases, category) SELECT id, name, ?, category FROM items WHERE id = ?",
+            ((" ".join(per_item.get(item_id, [])), item_id) for item_id in names.values()),
+        )
+        conn.executemany("INSERT INTO terms_trigram (term, item_id) VALUES (?, ?)", alias_rows.items())
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("version", version),
+            ("source", os.path.abspath(json_path)),
+            ("imported_at", datetime.now().isoformat()),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    return version
+
+
+class SqliteCatalog:
+    """
+    Read-only catalog backed by a database built with import_catalog.
+
+    Offers the same lookup/resolve/spot methods as CatalogIndex, plus search() to pull
+    only the rows relevant to an utterance instead of the whole price list.
+    """
+
+    def __init__(self, db_path: str, fuzzy_threshold: float = 0.8, **_ignored):
+        self.db_path = db_path
+        self.fuzzy_threshold = fuzzy_threshold
+        self._local = threading.local()
+        conn = self._conn()
+        self.version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        self._count = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        self._categories = [row[0] for row in conn.execute("SELECT DISTINCT category FROM items ORDER BY category")]
+        self.max_words = conn.execute(
+            "SELECT MAX(LENGTH(alias) - LENGTH(REPLACE(alias, ' ', '')) + 1) FROM aliases"
+        ).fetchone()[0] or 1
+
+    def _conn(self):
+        # sqlite connections can't be shared across threads; one read-only connection per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def alias(self, alias: str):
+        """Canonical name for an exact (already normalized) name or alias, or None"""
+        row = self._conn().execute(
+            "SELECT items.name FROM aliases JOIN items ON items.id = aliases.item_id WHERE aliases.alias = ?",
+            (alias,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def resolve(self, item_name: str, fuzzy: bool = True):
+        """Map a spoken/typed item name to its canonical catalog name, or None"""
+        query = normalize_name(item_name)
+        if not query:
+            return None
+        words = query.split()
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                hit = self.alias(" ".join(words[start:start + size]))
+                if hit:
+                    return hit
+        hits = self.search(query, limit=1)
+        if hits:
+            return hits[0][0]
+        if fuzzy:
+            return self.spot(query)[0]
+        return None
+
+    def lookup(self, item_name: str):
+        """Return (price, category) for an item name, or (None, None)"""
+        name = self.resolve(item_name)
+        if name is None:
+            return None, None
+        return self.get(name)
+
+    def get(self, name: str):
+        """(price, category) for an already canonical name, or (None, None)"""
+        row = self._conn().execute("SELECT price, category FROM items WHERE name = ?", (name,)).fetchone()
+        return row or (None, None)
+
+    def category_names(self):
+        return list(self._categories)
+
+    def category_items(self, category: str, limit: int = 20):
+        """Rows (name, price, category) from one category"""
+        return self._conn().execute(
+            "SELECT name, price, category FROM items WHERE category = ? ORDER BY id LIMIT ?", (category, limit)
+        ).fetchall()
+
+    def search(self, text: str, limit: int = 20, columns: str = "name aliases"):
+        """Rows (name, price, category) whose name, alias or category shares a whole word with text"""
+        words = _WORD_RE.findall((text or "").lower())
+        if not words:
+            return []
+        match = "{%s}: (%s)" % (columns, " OR ".join(f'"{w}"' for w in dict.fromkeys(words)))
+        return self._conn().execute(
+            "SELECT items.name, items.price, items.category FROM items_fts "
+            "JOIN items ON items.id = items_fts.rowid WHERE items_fts MATCH ? "
+            "ORDER BY bm25(items_fts, 10.0, 5.0, 1.0), LENGTH(items.name) LIMIT ?",
+            (match, limit),
+        ).fetchall()
+
+    def fuzzy_match(self, word: str, limit: int = 5, threshold: float = None):
+        """Ranked (name, score) candidates for a misheard word via the trigram FTS table"""
+        word = normalize_name(word)
+        if len(word) < 3 or is_common_word(word):
+            return []
+        threshold = self.fuzzy_threshold if threshold is None else threshold
+        grams = [g for g in trigrams(word) if " " not in g]
+        if not grams:
+            return []
+        match = " OR ".join(f'"{g}"' for g in grams)
+        rows = self._conn().execute(
+            "SELECT terms_trigram.term, items.name FROM terms_trigram "
+            "JOIN items ON items.id = terms_trigram.item_id "
+            "WHERE terms_trigram MATCH ? ORDER BY rank LIMIT 25",
+            (match,),
+        ).fetchall()
+        best = {}
+        for term, name in rows:
+            score = similarity(word, term)
+            if score >= threshold and score > best.get(name, 0.0):
+                best[name] = score
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [(name, round(score, 3)) for name, score in ranked[:limit]]
+
+    def spot(self, text: str, threshold: float = None):
+        """Best fuzzy item mention among the words of an utterance"""
+        found = (None, 0.0)
+        for word in (text or "").lower().split():
+            word = word.strip(".,!?;:'\"")
+            if len(word) < 4 or word in STOPWORDS or is_common_word(word) or not word.isalpha():
+                continue
+            hits = self.fuzzy_match(word, limit=1, threshold=threshold)
+            if hits and hits[0][1] > found[1]:
+                found = hits[0]
+        return found
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="SQLite catalog tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="build a catalog database from a prices JSON file")
+    imp.add_argument("json_path", nargs="?", default="grocery_prices.json")
+    imp.add_argument("db_path", nargs="?", default="catalog.db")
+    imp.add_argument("--aliases", default="item_aliases.json", help="alias -> item JSON (skipped if missing)")
+    find = sub.add_parser("search", help="look up an item in a catalog database")
+    find.add_argument("query")
+    find.add_argument("--db", default="catalog.db")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        started = time.perf_counter()
+        aliases = None
+        if os.path.exists(args.aliases):
+            with open(args.aliases) as fh:
+                aliases = json.load(fh)
+        version = import_catalog(args.json_path, args.db_path, extra_aliases=aliases)
+        catalog = SqliteCatalog(args.db_path)
+        print(f"✅ Imported {len(catalog)} items into {args.db_path} (version {version}) "
+              f"in {time.perf_counter() - started:.2f}s")
+    else:
+        catalog = SqliteCatalog(args.db)
+        print("resolve:", catalog.resolve(args.query), catalog.lookup(args.query))
+        for row in catalog.search(args.query, limit=10):
+            print("  ", row)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,130 @@
+"""
+Per-turn deadline budget for model calls.
+
+A Deadline starts when the request arrives. Blocking model calls run on a small pool so the
+request thread can stop waiting when the budget runs out; the abandoned call is discarded
+(its late result can still be handed to a callback, e.g. to fill the response cache).
+Async callers use asyncio.wait_for with the same remaining budget, which cancels the call.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds: float, reserve: float = 0.0):
+        # seconds <= 0 means no deadline; reserve is kept back for building the local answer
+        self.started = time.monotonic()
+        self.expires = self.started + seconds - reserve if seconds > 0 else None
+
+    def remaining(self):
+        """Seconds left for the model, None when unbounded"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def elapsed_ms(self) -> float:
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+
+def configure(max_workers: int):
+    """Size of the pool blocking model calls run on (call once at startup)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-call")
+
+
+def _pool():
+    if _executor is None:
+        configure(32)
+    return _executor
+
+
+def call(fn, deadline: Deadline, on_late_result=None, on_done=None):
+    """
+    Run fn() within the deadline. Raises DeadlineExceeded when the budget runs out first; the
+    call is cancelled if it hadn't started, otherwise discarded and its eventual result passed
+    to on_late_result. on_done() runs once the call has really ended (or was cancelled), even
+    if the caller stopped waiting long before.
+    """
+    remaining = deadline.remaining()
+    if remaining is None or remaining <= 0:
+        try:
+            if remaining is None:
+                return fn()
+            raise DeadlineExceeded()
+        finally:
+            if on_done is not None:
+                on_done()
+    future = _pool().submit(fn)
+    if on_done is not None:
+        future.add_done_callback(lambda f: on_done())
+    try:
+        return future.result(timeout=remaining)
+    except FutureTimeout:
+        if not future.cancel():
+            metrics.incr("model_calls_discarded")
+            if on_late_result is not None:
+                future.add_done_callback(
+                    lambda f: f.exception() is None and on_late_result(f.result()))
+        raise DeadlineExceeded() from None
+
+
+def iterate(make_iter, deadline: Deadline, on_done=None):
+    """
+    Yield from the iterator make_iter() (a streaming model response) within the deadline.
+    Pieces are pulled on a pool thread; when the budget runs out DeadlineExceeded is raised
+    here and the producer stops after its current piece, as it does when this generator is
+    closed early (the client hung up). on_done() runs when the producer ends.
+    """
+    if deadline.remaining() is None:
+        try:
+            yield from make_iter()
+        finally:
+            if on_done is not None:
+                on_done()
+        return
+    pieces = queue.Queue()
+    abandoned = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for piece in make_iter():
+                if abandoned.is_set():
+                    return
+                pieces.put(piece)
+        except Exception as e:
+            pieces.put(e)
+        finally:
+            if on_done is not None:
+                on_done()
+        pieces.put(done)
+
+    _pool().submit(produce)
+    try:
+        while True:
+            try:
+                piece = pieces.get(timeout=deadline.remaining())
+            except queue.Empty:
+                metrics.incr("model_calls_discarded")
+                raise DeadlineExceeded() from None
+            if piece is done:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+    finally:
+        # deadline, error or GeneratorExit at the yield: the producer has nobody to feed
+        abandoned.set()
@@ -0,0 +1,174 @@
+from collections import Counter
+
+# conversational words that must never be "corrected" into an item ("price" -> "rice")
+STOPWORDS = {
+    "add", "and", "any", "are", "buy", "can", "cart", "cost", "does", "for", "from", "get", "give",
+    "have", "how", "kilo", "kilos", "like", "list", "many", "much", "need", "order", "please", "price",
+    "purchase", "rate", "remove", "show", "some", "that", "the", "then", "this", "want", "what",
+    "with", "would", "you", "your",
+}
+
+# everyday English words a few edits away from an item name ("better" ~ butter, "paste" ~ pasta,
+# "salty" ~ salt): never fuzzy-matched, only taken when they are an item or alias name themselves
+COMMON_WORDS = {
+    "about", "after", "again", "also", "always", "another", "anything", "back", "batter", "because", "been",
+    "before", "being", "best", "better", "between", "bigger", "biter", "bitter", "both", "bring", "brown",
+    "call", "came", "cheap", "cheaper", "cheers", "choose", "cold", "come", "cook", "cooking", "could", "dinner",
+    "done", "down", "each", "else", "even", "every", "fine", "first", "fresh", "fresher", "full", "good",
+    "great", "healthy", "hello", "help", "here", "just", "keep", "kind", "know", "last", "later", "less",
+    "little", "long", "look", "lunch", "made", "make", "maybe", "meal", "mile", "milky", "mind", "more", "most",
+    "must", "never", "next", "nice", "okay", "only", "other", "over", "paste", "pastry", "potter", "rather",
+    "really", "recipe", "right", "rise", "said", "salty", "same", "should", "since", "small", "soft", "sorry",
+    "spicy", "still", "such", "sure", "sweet", "take", "taste", "tasty", "tell", "than", "thank", "thanks",
+    "their", "them", "there", "these", "they", "thing", "things", "think", "those", "time", "today",
+    "tomorrow", "tonight", "very", "water", "well", "were", "when", "where", "which", "while", "white",
+    "will", "wish", "without", "work", "worse", "write", "yeah", "yellow",
+}
+
+_SOUNDEX_CODES = {}
+for _letters, _digit in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")):
+    for _ch in _letters:
+        _SOUNDEX_CODES[_ch] = _digit
+
+# spelling pairs that sound alike, folded before the Soundex pass (metaphone-style)
+_PHONETIC_FOLDS = (("ph", "f"), ("ck", "k"), ("gh", "g"), ("wh", "w"), ("kn", "n"), ("qu", "kw"))
+
+
+def phonetic_key(word: str) -> str:
+    """Soundex code of a word after folding a few sound-alike spellings ("brocoli" == "broccoli")"""
+    word = "".join(ch for ch in (word or "").lower() if ch.isalpha())
+    if not word:
+        return ""
+    for src, dst in _PHONETIC_FOLDS:
+        word = word.replace(src, dst)
+    first = word[0]
+    code = [first.upper()]
+    prev = _SOUNDEX_CODES.get(first, "")
+    for ch in word[1:]:
+        digit = _SOUNDEX_CODES.get(ch, "")
+        if digit and digit != prev:
+            code.append(digit)
+        if ch not in "hw":
+            prev = digit
+    return ("".join(code) + "000")[:4]
+
+
+def trigrams(text: str):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    """1 - normalized Levenshtein distance"""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return 1.0 - prev[-1] / len(a)
+
+
+def is_common_word(word: str) -> bool:
+    return word in COMMON_WORDS
+
+
+class FuzzyMatcher:
+    """
+    Typo / mishearing tolerant matcher over catalog names.
+
+    Candidates come from a trigram index (spelling) and a phonetic-key index (sound);
+    only the best few are re-scored with edit distance, so a query touches a few
+    posting lists instead of the whole catalog.
+    """
+
+    def __init__(self, names, threshold: float = 0.8, max_candidates: int = 25):
+        # names: iterable of matchable strings, or a dict {matchable string -> canonical name}
+        if not isinstance(names, dict):
+            names = {n: n for n in names}
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.terms = list(names)
+        self.canonical = [names[t] for t in self.terms]
+        self.exact = set(self.terms)
+        self.keys = []
+        self.trigram_index = {}
+        self.phonetic_index = {}
+        for term_id, term in enumerate(self.terms):
+            for g in trigrams(term):
+                self.trigram_index.setdefault(g, []).append(term_id)
+            key = phonetic_key(term)
+            self.keys.append(key)
+            self.phonetic_index.setdefault(key, []).append(term_id)
+        # trigrams shared by a large share of the catalog carry no signal and cost the most to count
+        self.common_limit = max(50, len(self.terms) // 20)
+
+    def match(self, query: str, limit: int = 5, threshold: float = None):
+        """Return up to `limit` (canonical_name, score) pairs, best first, scoring >= threshold"""
+        query = " ".join((query or "").lower().split())
+        if len(query) < 3:
+            return []
+        if query in COMMON_WORDS and query not in self.exact:
+            return []
+        threshold = self.threshold if threshold is None else threshold
+        qgrams = trigrams(query)
+        postings = [self.trigram_index[g] for g in qgrams if g in self.trigram_index]
+        selective = [p for p in postings if len(p) <= self.common_limit] or postings
+        counts = Counter()
+        for plist in selective:
+            counts.update(plist)
+        qkey = phonetic_key(query)
+        sound_alike = self.phonetic_index.get(qkey, ())
+        candidates = {term_id for term_id, _ in counts.most_common(self.max_candidates)}
+        candidates.update(sound_alike[:self.max_candidates])
+
+        # cheap upper bound first (trigram overlap, sound-alike, length ratio); edit distance only
+        # runs for candidates that could still beat the current results
+        bounded = []
+        for term_id in candidates:
+            term = self.terms[term_id]
+            # recomputed for the few candidates rather than kept per term (large at 100k+ names)
+            grams = trigrams(term)
+            dice = 2.0 * len(qgrams & grams) / (len(qgrams) + len(grams))
+            # sounding alike only counts between words of about the same length and the same first
+            # letter; otherwise "salty" -> salt or "milky" -> milk would clear the threshold on sound alone
+            bonus = 0.1 if (self.keys[term_id] == qkey and abs(len(term) - len(query)) <= 1
+                            and term[0] == query[0] and not query.startswith(term)) else 0.0
+            length_sim = min(len(query), len(term)) / max(len(query), len(term))
+            bounded.append((0.7 * length_sim + 0.3 * dice + bonus, dice, bonus, term_id))
+        bounded.sort(reverse=True)
+
+        best = {}
+        for upper, dice, bonus, term_id in bounded:
+            floor = max(threshold, sorted(best.values(), reverse=True)[limit - 1] if len(best) >= limit else 0.0)
+            if upper < floor:
+                break
+            score = min(0.7 * similarity(query, self.terms[term_id]) + 0.3 * dice + bonus, 1.0)
+            name = self.canonical[term_id]
+            if score >= threshold and score > best.get(name, 0.0):
+                best[name] = score
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [(name, round(score, 3)) for name, score in ranked[:limit]]
+
+    def best(self, query: str, threshold: float = None):
+        """Best (canonical_name, score) for the query, or (None, 0.0) below the threshold"""
+        hits = self.match(query, limit=1, threshold=threshold)
+        return hits[0] if hits else (None, 0.0)
+
+    def spot(self, text: str, threshold: float = None):
+        """Best fuzzy item mention among the words of an utterance, skipping conversational words"""
+        found = (None, 0.0)
+        for word in (text or "").lower().split():
+            word = word.strip(".,!?;:'\"")
+            if len(word) < 4 or word in STOPWORDS or is_common_word(word) or not word.isalpha():
+                continue
+            name, score = self.best(word, threshold=threshold)
+            if name and score > found[1]:
+                found = (name, score)
+        return found
@@ -0,0 +1,68 @@
+"""Rule-based intent classification so deterministic turns can be answered without the model"""
+from typing import NamedTuple
+
+from nlu import has_cue
+
+# utterances longer than this are rarely a plain command
+MAX_COMMAND_WORDS = 14
+
+
+class Intent(NamedTuple):
+    name: str          # view_cart, clear_cart, remove_item, add_item, price_query, greeting, open
+    confidence: float  # 0..1; callers answer locally above their threshold
+    item: str = None
+    quantity: int = 1
+
+
+def wants_to_order(analysis) -> bool:
+    # "don't add apples" is not an order; the model sorts out what was meant
+    return "order" in analysis.cues and "negation" not in analysis.cues
+
+
+def removed_items(analysis) -> set:
+    """Items named in segments that say remove ("add apples and remove onions" -> {"onion"})"""
+    return {item for segment in analysis.segments if has_cue(segment, "remove") for item in segment.items}
+
+
+def remove_target(analysis):
+    """The one item a remove command names, from the segment that says remove; None for zero or several"""
+    named = [item for segment in analysis.segments for item in segment.items]
+    if len(named) != 1:
+        return None
+    for segment in analysis.segments:
+        if segment.items and has_cue(segment, "remove"):
+            return segment.items[0]
+    return None
+
+
+def classify(analysis, item: str = None, quantity: int = 1, item_known: bool = False) -> Intent:
+    """
+    Classify one utterance from its nlu.Analysis. `item`/`quantity` are the first item the
+    parser found and `item_known` says whether the catalog resolved it.
+    """
+    cues = analysis.cues
+    # long or advice-seeking turns keep a low confidence so they go to the model
+    penalty = 0.0
+    if len(analysis.words) > MAX_COMMAND_WORDS or analysis.truncated:
+        penalty += 0.3
+    if "open" in cues:
+        penalty += 0.4
+    # "don't clear my cart", "please don't remove the onions"
+    if "negation" in cues:
+        penalty += 0.6
+
+    if "view_cart" in cues:
+        return Intent("view_cart", 0.95 - penalty / 2)
+    if "clear_cart" in cues:
+        return Intent("clear_cart", 0.95 - penalty)
+    if "remove" in cues:
+        # mixed add/remove turns and removes of several items go to the model
+        target = None if "order" in cues else remove_target(analysis)
+        return Intent("remove_item", (0.9 if target else 0.4) - penalty, target or item, quantity)
+    if "price" in cues:
+        return Intent("price_query", (0.9 if item_known else 0.5) - penalty, item, quantity)
+    if "order" in cues:
+        return Intent("add_item", (0.9 if item_known else 0.4) - penalty, item, quantity)
+    if "greeting" in cues:
+        return Intent("greeting", 0.9)
+    return Intent("open", 0.0, item, quantity)
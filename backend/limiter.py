@@ -0,0 +1,146 @@
+"""
+Concurrency limit and brownout for model calls.
+
+At most max_in_flight model calls run at once; up to max_queue more turns wait for a slot in
+FIFO order. A turn that finds the queue full is refused with Overloaded, and that starts a
+brownout: for the next brownout_seconds every model-bound turn is answered locally (intent
+templates, prices, cart) without queueing, which lets the backlog drain instead of every
+user timing out. Threads and asyncio tasks share the same slots and queue.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+import metrics
+
+
+class Overloaded(Exception):
+    """The model queue is full (or a brownout is on): answer locally"""
+
+
+class QueueTimeout(TimeoutError):
+    """The turn's deadline ran out while it was waiting for a model slot"""
+
+
+class _Waiter:
+    """One queued turn; grant() hands it a slot (called with the limiter lock held)"""
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self) -> bool:
+        if self.future is not None:
+            if self.future.done():   # already resolved; never hand it a second slot
+                return False
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+        else:
+            self.event.set()
+        self.granted = True
+        return True
+
+
+class ModelLimiter:
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 32, brownout_seconds: float = 5.0):
+        # max_in_flight <= 0 means no limit (and no brownout)
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.brownout_seconds = brownout_seconds
+        self._in_flight = 0
+        self._waiters = deque()
+        self._brownout_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def in_brownout(self) -> bool:
+        return time.monotonic() < self._brownout_until
+
+    def _report(self):
+        # caller holds the lock
+        metrics.set_gauge("model_in_flight", self._in_flight)
+        metrics.set_gauge("model_queue_depth", len(self._waiters))
+
+    def _enter(self, loop=None):
+        """None when a slot was taken right away, else the queued _Waiter; raises Overloaded"""
+        with self._lock:
+            if self.in_brownout():
+                raise Overloaded("brownout")
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                self._report()
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._brownout_until = time.monotonic() + self.brownout_seconds
+                metrics.incr("brownout_activations")
+                print(f"🟠 Model queue full ({self._in_flight} running, {len(self._waiters)} waiting) — "
+                      f"answering locally for {self.brownout_seconds:g}s")
+                raise Overloaded("model queue full")
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            self._report()
+            return waiter
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """Leave the queue after a timeout or cancellation; True if a slot was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._report()
+            return False
+
+    def acquire(self, timeout: float = None):
+        """Take a model slot, waiting up to timeout seconds (None: no limit) in the queue"""
+        if not self.enabled:
+            return
+        waiter = self._enter()
+        if waiter is None or waiter.event.wait(timeout):
+            return
+        if not self._give_up(waiter):
+            metrics.incr("model_queue_timeouts")
+            raise QueueTimeout()
+
+    async def acquire_async(self, timeout: float = None):
+        if not self.enabled:
+            return
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if not self._give_up(waiter):
+                metrics.incr("model_queue_timeouts")
+                raise QueueTimeout() from None
+        except asyncio.CancelledError:
+            if self._give_up(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        """Return a slot; it goes straight to the longest-waiting turn, if any"""
+        if not self.enabled:
+            return
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.grant():
+                    self._report()
+                    return
+            self._in_flight -= 1
+            self._report()
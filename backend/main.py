@@ -4,23 +4,49 @@ import json
 import re
 import uuid
 import tempfile
+import time
 from datetime import datetime
-from flask import Flask, request, jsonify, session, send_file
-from flask_session import Session
+from typing import NamedTuple
+from flask import Flask, Response, request, jsonify, session, send_file, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from fpdf import FPDF
-
-# Optional Gemini imports (guarded)
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None
+from catalog import CatalogStore
+from cart_parser import parse_items, segment_quantity
+from prompt_builder import (build_context, estimate_tokens, full_catalog_tokens, mentioned_categories, render_catalog,
+                            select_catalog)
+import breaker
+import cart_actions
+import deadline
+import intents
+import limiter
+import metrics
+import model_backend
+import nlu
+from quantities import UNITS, format_quantity, per_unit, pricing_unit, to_pricing_unit
+from streaming import SentenceChunker, sse
+from response_cache import ResponseCache, cache_key
+from session_log import OFFSET_KEY, SessionLog
+from session_store import SqliteSessionInterface, SqliteSessionStore, TrackedFileSystemSessionInterface
+from singleflight import FlightGroup, prompt_key
+from write_behind import WriteBehind, flush_on_shutdown
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# where sessions live: "sqlite" (one WAL database shared by all workers, see session_store.py)
+# or "filesystem" (Flask-Session, one pickle file per session in ./flask_session)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+# sessions each worker keeps parsed in memory (LRU); 0 reads every request from the database
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+# seconds between sweeps of expired sessions out of the database
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", "60"))
+# sessions are only written when they change; an unchanged one is rewritten (expiry and cookie
+# pushed back) at most this often, so keep it well under PERMANENT_SESSION_LIFETIME
+SESSION_REFRESH_SECONDS = float(os.getenv("SESSION_REFRESH_SECONDS", "300"))
+
 app.config.update(
     SECRET_KEY=os.getenv("FLASK_SECRET_KEY", "change-this-secret"),
     SESSION_TYPE="filesystem",
@@ -33,11 +59,22 @@ app.config.update(
 )
 
 # ensure dirs exist
-os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
 os.makedirs("./saved_sessions", exist_ok=True)
 os.makedirs("./tmp_pdfs", exist_ok=True)
 
-Session(app)
+if SESSION_BACKEND == "sqlite":
+    session_store = SqliteSessionStore(SESSION_DB_PATH, SESSION_CACHE_SIZE, SESSION_PURGE_INTERVAL)
+    app.session_interface = SqliteSessionInterface(session_store, app.config.get("SESSION_USE_SIGNER", False),
+                                                   app.config["SESSION_PERMANENT"], SESSION_REFRESH_SECONDS)
+else:
+    os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
+    # what Session(app) would install for SESSION_TYPE="filesystem" (same defaults)
+    app.session_interface = TrackedFileSystemSessionInterface(
+        app.config["SESSION_FILE_DIR"], app.config.get("SESSION_FILE_THRESHOLD", 500),
+        app.config.get("SESSION_FILE_MODE", 0o600), app.config.get("SESSION_KEY_PREFIX", "session:"),
+        app.config.get("SESSION_USE_SIGNER", False), app.config["SESSION_PERMANENT"],
+        refresh_seconds=SESSION_REFRESH_SECONDS)
+print(f"🗂️ Session backend: {SESSION_BACKEND}")
 
 # NOTE: add your frontend origin or your phone's origin here for mobile testing
 CORS(app, supports_credentials=True, origins=[
@@ -48,36 +85,130 @@ CORS(app, supports_credentials=True, origins=[
 ])
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY and genai:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel("gemini-2.0-flash")
-else:
-    model = None
-    if not GEMINI_API_KEY:
-        print("⚠️ GEMINI_API_KEY not set — model responses will be stubbed.")
-
-# load grocery prices or create fallback
-try:
-    with open("grocery_prices.json", "r") as f:
-        grocery_prices = json.load(f)
-    print("✅ Grocery prices loaded")
-except FileNotFoundError:
+# gemini, fake (local stand-in for load tests, no network) or none
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# fake backend: latency distribution in ms (fixed:800, uniform:200:1500, normal:800:200, lognormal:700:0.5),
+# share of calls that fail, and the seed that makes its timings and replies repeatable
+FAKE_MODEL_LATENCY = os.getenv("FAKE_MODEL_LATENCY", "lognormal:700:0.4")
+FAKE_MODEL_ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0"))
+FAKE_MODEL_SEED = int(os.getenv("FAKE_MODEL_SEED", "0"))
+model = model_backend.create(MODEL_BACKEND, api_key=GEMINI_API_KEY, model_name=GEMINI_MODEL,
+                             latency=FAKE_MODEL_LATENCY, error_rate=FAKE_MODEL_ERROR_RATE, seed=FAKE_MODEL_SEED)
+if model is not None:
+    print(f"🤖 Model backend: {model.name}")
+
+# create sample grocery prices if the file is missing
+if not os.path.exists("grocery_prices.json"):
     print("⚠️ grocery_prices.json not found — creating sample prices")
-    grocery_prices = {
-        "fruits": {"apple": 80, "banana": 40, "orange": 60},
-        "vegetables": {"potato": 30, "tomato": 40, "onion": 25},
-        "dairy": {"milk": 60, "eggs": 80},
-        "grains": {"rice": 80, "wheat": 40},
-        "other": {"sugar": 45, "salt": 20},
-    }
     with open("grocery_prices.json", "w") as f:
-        json.dump(grocery_prices, f, indent=2)
+        json.dump({
+            "fruits": {"apple": 80, "banana": 40, "orange": 60},
+            "vegetables": {"potato": 30, "tomato": 40, "onion": 25},
+            "dairy": {"milk": 60, "eggs": 80},
+            "grains": {"rice": 80, "wheat": 40},
+            "other": {"sugar": 45, "salt": 20},
+        }, f, indent=2)
+
+# minimum fuzzy score (0..1) before a misheard name like "tamato" is accepted as a catalog item
+FUZZY_MATCH_THRESHOLD = float(os.getenv("FUZZY_MATCH_THRESHOLD", "0.8"))
+# seconds between catalog change checks; 0 disables hot reload
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "2"))
+# "memory" (grocery_prices.json compiled in-process) or "sqlite" (CATALOG_DB_PATH, see catalog_sqlite.py)
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "memory").lower()
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "catalog.db")
+# regional/alternate item names ({"aloo": "potato", ...}); reloaded with the catalog in memory mode
+ITEM_ALIASES_PATH = os.getenv("ITEM_ALIASES_PATH", "item_aliases.json")
+# token budget for the catalog section of each model prompt (only relevant rows are sent)
+PROMPT_CATALOG_TOKEN_BUDGET = int(os.getenv("PROMPT_CATALOG_TOKEN_BUDGET", "400"))
+# minimum intent confidence (0..1) for answering a turn from templates instead of the model
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+# token budget for cart + last order + chat history in each model prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+# how many recent chat messages are considered when filling that budget
+CONTEXT_HISTORY_SCAN = int(os.getenv("CONTEXT_HISTORY_SCAN", "30"))
+# chat messages kept in the session (0 = all); older ones stay in saved_sessions and /history pages them
+# back in. Keep it at least CONTEXT_HISTORY_SCAN and the 20 messages the PDF shows.
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "40"))
+# largest /history page
+HISTORY_PAGE_LIMIT = int(os.getenv("HISTORY_PAGE_LIMIT", "100"))
+# cached model replies (LRU); 0 entries or 0 seconds TTL disables the cache
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# seed the reply cache from saved_sessions at startup
+RESPONSE_CACHE_WARM = os.getenv("RESPONSE_CACHE_WARM", "1") == "1"
+# saved_sessions are append-only logs; one that grows past this many bytes is folded into its
+# snapshot by a background pass every SESSION_LOG_COMPACT_INTERVAL seconds (0 = never)
+SESSION_LOG_COMPACT_BYTES = int(os.getenv("SESSION_LOG_COMPACT_BYTES", "65536"))
+SESSION_LOG_COMPACT_INTERVAL = float(os.getenv("SESSION_LOG_COMPACT_INTERVAL", "30"))
+# saved-session writes leave the request thread: a background writer gathers them for this many
+# seconds, then appends and fsyncs them in one batch (0 = write on the request thread)
+SESSION_PERSIST_WINDOW = float(os.getenv("SESSION_PERSIST_WINDOW", "0.2"))
+# sessions allowed to wait for the writer; past that, requests write their own events
+SESSION_PERSIST_MAX_PENDING = int(os.getenv("SESSION_PERSIST_MAX_PENDING", "1000"))
+# fsync each batch before it counts as written
+SESSION_PERSIST_FSYNC = os.getenv("SESSION_PERSIST_FSYNC", "1") == "1"
+# seconds an /ai turn may take before it is answered locally instead of by the model; 0 = no limit
+AI_DEADLINE_SECONDS = float(os.getenv("AI_DEADLINE_SECONDS", "5"))
+# part of that budget kept back for building and sending the local answer
+AI_DEADLINE_RESERVE = float(os.getenv("AI_DEADLINE_RESERVE", "0.2"))
+# threads available to blocking model calls (the request thread waits on them with a timeout)
+MODEL_CALL_WORKERS = int(os.getenv("MODEL_CALL_WORKERS", "32"))
+# identical turns in flight at the same time share one model call; others wait up to this long for it (0 = off)
+COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", "3"))
+# directory shared by all workers on this host, to coalesce across processes too (empty = per process)
+COALESCE_LOCK_DIR = os.getenv("COALESCE_LOCK_DIR", "")
+# at most this many model calls run at once (0 = no limit); further turns queue for a slot
+MODEL_MAX_IN_FLIGHT = int(os.getenv("MODEL_MAX_IN_FLIGHT", "16"))
+# turns allowed to wait in that queue; a turn that finds it full starts a brownout
+MODEL_MAX_QUEUE = int(os.getenv("MODEL_MAX_QUEUE", "32"))
+# how long a brownout lasts: model-bound turns are answered locally instead of queueing
+BROWNOUT_SECONDS = float(os.getenv("BROWNOUT_SECONDS", "5"))
+# circuit breaker: over the last BREAKER_WINDOW model calls (0 = off), once at least BREAKER_MIN_CALLS
+# are in and BREAKER_FAILURE_RATE of them failed, timed out or took over BREAKER_SLOW_SECONDS,
+# skip the model for BREAKER_OPEN_SECONDS, then let one probe call through
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "4"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+# /ai asks the model for its reply plus structured cart actions (add/remove/set/query), checked against
+# the catalog and applied in one batch, instead of parsing the cart change locally for turns sent to the model
+STRUCTURED_REPLIES = os.getenv("STRUCTURED_REPLIES", "0") == "1"
+
+# prices + compiled index live in an immutable snapshot that is swapped whole when the source changes
+if CATALOG_BACKEND == "sqlite":
+    catalog_store = CatalogStore(CATALOG_DB_PATH, backend="sqlite", fuzzy_threshold=FUZZY_MATCH_THRESHOLD)
+else:
+    catalog_store = CatalogStore("grocery_prices.json", aliases_path=ITEM_ALIASES_PATH,
+                                 fuzzy_threshold=FUZZY_MATCH_THRESHOLD)
+catalog_store.start_watching(CATALOG_RELOAD_INTERVAL)
+print("✅ Grocery prices loaded")
+
+saved_sessions = SessionLog("saved_sessions", SESSION_LOG_COMPACT_BYTES, SESSION_PERSIST_FSYNC)
+if SESSION_PERSIST_WINDOW > 0:
+    saved_sessions.writer = WriteBehind(saved_sessions.write_batch, SESSION_PERSIST_WINDOW, SESSION_PERSIST_MAX_PENDING)
+    flush_on_shutdown(saved_sessions.writer)
+saved_sessions.start_compacting(SESSION_LOG_COMPACT_INTERVAL)
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+deadline.configure(MODEL_CALL_WORKERS)
+model_flights = FlightGroup(COALESCE_WAIT_SECONDS, COALESCE_LOCK_DIR or None)
+model_limiter = limiter.ModelLimiter(MODEL_MAX_IN_FLIGHT, MODEL_MAX_QUEUE, BROWNOUT_SECONDS)
+model_breaker = breaker.CircuitBreaker(BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATE,
+                                       BREAKER_SLOW_SECONDS, BREAKER_OPEN_SECONDS)
+if RESPONSE_CACHE_WARM:
+    _catalog = catalog_store.current
+    _warmed = response_cache.warm_from_sessions(
+        (state for _, state in saved_sessions.recent(500)), lambda text: nlu.analyze(text, _catalog.index),
+        _catalog.version, _catalog.index.category_names())
+    print(f"🔥 Response cache warmed with {_warmed} replies")
 
 
 # ----------------- helpers -----------------
 def init_session():
     """Ensure session structure exists"""
-    session.permanent = True
+    if not session.permanent:   # assigning marks the session modified, so only when it changes
+        session.permanent = True
     if "session_id" not in session:
         session["session_id"] = str(uuid.uuid4())
         session["chat_history"] = []
@@ -87,6 +218,7 @@ def init_session():
             "total_items": 0,
             "created_at": datetime.now().isoformat(),
             "last_updated": datetime.now().isoformat(),
+            "version": 0,
         }
         session["user_context"] = {"name": "", "last_order_items": [], "preferences": {}}
         session.modified = True
@@ -123,135 +255,227 @@ def safe_text(s: str) -> str:
 
 
 def get_item_price(item_name: str):
-    item_name_lower = (item_name or "").lower().strip()
-    for category, items in grocery_prices.items():
-        if item_name_lower in items:
-            return items[item_name_lower], category
-    # partial match
-    for category, items in grocery_prices.items():
-        for item in items:
-            if item_name_lower in item or item in item_name_lower:
-                return items[item], category
-    return None, None
+    """Exact, plural/singular, whole-word partial and fuzzy lookup via the compiled catalog index"""
+    return catalog_store.current.index.lookup(item_name)
+
+
+def build_catalog_context(user_prompt: str) -> str:
+    """Compact price list limited to what this turn needs (mentioned, cart, recent, asked-about categories)"""
+    catalog = catalog_store.current
+    selected = select_catalog(
+        catalog.index,
+        user_prompt,
+        cart_items=session["shopping_cart"]["items"],
+        recent_items=session["user_context"]["last_order_items"][-3:],
+        token_budget=PROMPT_CATALOG_TOKEN_BUDGET,
+    )
+    text = render_catalog(selected, catalog.index.category_names())
+    full_tokens = full_catalog_tokens(catalog)
+    sent_tokens = estimate_tokens(text)
+    metrics.incr("prompt_catalog_turns")
+    metrics.incr("prompt_catalog_tokens_full", full_tokens)
+    metrics.incr("prompt_catalog_tokens_sent", sent_tokens)
+    print(f"🧾 Catalog in prompt: ~{full_tokens} -> ~{sent_tokens} tokens")
+    return text
+
+
+def touch_cart(cart: dict):
+    """Recompute totals and bump the cart version (invalidates the cached prompt rendering)"""
+    cart["subtotal"] = round(sum(it["total"] for it in cart["items"]), 2)
+    cart["total_items"] = round(sum(it["quantity"] for it in cart["items"]), 3)
+    cart["last_updated"] = datetime.now().isoformat()
+    cart["version"] = cart.get("version", 0) + 1
+
+
+def add_items_to_cart(entries):
+    """
+    Add several (item_name, quantity) pairs in one cart mutation: a single totals recompute and
+    version bump however many items the utterance named. Quantities are in each item's pricing
+    unit (see quantities.pricing_unit). Returns (added, missing) where added holds
+    (canonical_name, quantity) pairs.
+    """
+    init_session()
+    cart = session["shopping_cart"]
+    # one snapshot for the whole mutation, even if a reload lands meanwhile
+    index = catalog_store.current.index
+    lines = {it["item"].lower(): it for it in cart["items"]}
+    added, missing = [], []
+    for item_name, quantity in entries:
+        # store the canonical name so "apples" and "apple" land on the same cart line
+        name = index.resolve(item_name)
+        price, category = index.get(name) if name else (None, None)
+        if price is None:
+            missing.append(item_name)
+            continue
+        line = lines.get(name.lower())
+        if line:
+            line["quantity"] = round(line["quantity"] + quantity, 3)
+            line["total"] = round(line["quantity"] * line["price"], 2)
+        else:
+            line = {"item": name, "quantity": quantity, "unit": pricing_unit(name), "price": price,
+                    "category": category, "total": round(price * quantity, 2)}
+            cart["items"].append(line)
+            lines[name.lower()] = line
+        added.append((name, quantity))
+    if added:
+        touch_cart(cart)
+        session.modified = True
+    return added, missing
 
 
 def update_shopping_cart(action, item_name=None, quantity=1):
     init_session()
     cart = session["shopping_cart"]
     if action == "add":
-        price, category = get_item_price(item_name)
-        if price is None:
+        added, missing = add_items_to_cart([(item_name, quantity)])
+        if missing:
             return False, f"Item '{item_name}' not found"
-        # find existing
-        item_found = False
-        for i, it in enumerate(cart["items"]):
-            if it["item"].lower() == item_name.lower():
-                cart["items"][i]["quantity"] += quantity
-                cart["items"][i]["total"] = cart["items"][i]["quantity"] * cart["items"][i]["price"]
-                item_found = True
-                break
-        if not item_found:
-            cart["items"].append({
-                "item": item_name,
-                "quantity": quantity,
-                "price": price,
-                "category": category,
-                "total": price * quantity
-            })
-        cart["subtotal"] = sum(it["total"] for it in cart["items"])
-        cart["total_items"] = sum(it["quantity"] for it in cart["items"])
-        cart["last_updated"] = datetime.now().isoformat()
+        return True, f"Added {describe_items(added)} to cart"
+    elif action == "remove":
+        item_name = catalog_store.current.index.resolve(item_name) or item_name
+        kept = [it for it in cart["items"] if it["item"].lower() != (item_name or "").lower()]
+        if len(kept) == len(cart["items"]):
+            return False, f"{item_name} is not in your cart."
+        cart["items"] = kept
+        touch_cart(cart)
         session.modified = True
-        return True, f"Added {quantity}kg of {item_name} to cart"
+        return True, f"Removed {item_name} from your cart."
     elif action == "clear":
-        cart["items"] = []
-        cart["subtotal"] = 0
-        cart["total_items"] = 0
-        cart["last_updated"] = datetime.now().isoformat()
-        session.modified = True
+        if cart["items"]:   # clearing an empty cart changes nothing, so it costs no session write
+            cart["items"] = []
+            touch_cart(cart)
+            session.modified = True
         return True, "Cart cleared"
     elif action == "view":
         return True, cart
     return False, "Invalid action"
 
 
-def build_conversation_context():
-    init_session()
-    chat_history_text = ""
-    if session.get("chat_history"):
-        for msg in session["chat_history"][-5:]:
-            role = "User" if msg.get("role") == "user" else "Assistant"
-            chat_history_text += f"{role}: {msg.get('message','')[:100]}\n"
-    cart_items_text = ""
-    if session["shopping_cart"]["items"]:
-        for it in session["shopping_cart"]["items"]:
-            # use ASCII 'Rs' to avoid rupee symbol
-            cart_items_text += f"- {it['quantity']}kg {it['item']} @ Rs{it['price']}/kg = Rs{it['total']}\n"
-    else:
-        cart_items_text = "Cart is empty"
-    context = f"""=== CONVERSATION HISTORY (Last 5 messages) ===
-{chat_history_text if chat_history_text else 'No previous conversation'}
-
-
-=== CURRENT SHOPPING CART ===
-{cart_items_text}
-Total Items: {session['shopping_cart']['total_items']}
-Subtotal: Rs{session['shopping_cart']['subtotal']}
+def build_conversation_context(skip_current: bool = True):
+    """Cart, last order and recent history for the prompt, sized to CONTEXT_TOKEN_BUDGET"""
+    history = session.get("chat_history", [])
+    if skip_current and history and history[-1].get("role") == "user":
+        # the current utterance is already in the prompt on its own line
+        history = history[:-1]
+    return build_context(
+        session["session_id"],
+        session["shopping_cart"],
+        history[-CONTEXT_HISTORY_SCAN:],
+        session["user_context"]["last_order_items"],
+        token_budget=CONTEXT_TOKEN_BUDGET,
+    )
 
 
-=== USER CONTEXT ===
-Last ordered items: {[x.get('item','') for x in session['user_context']['last_order_items'][-3:]]}
-"""
-    return context
-
-
-def extract_cart_info_from_prompt(user_prompt: str):
-    user_lower = (user_prompt or "").lower()
-    quantity = 1
-    item_name = None
-    patterns = [
-        r'(\d+)\s*(?:kg|kilos?|kilograms?|g|grams?)?\s+(?:of\s+)?([a-zA-Z]+)',
-        r'add\s+(\d+)?\s*([a-zA-Z]+)\s+to',
-        r'order\s+(\d+)?\s*([a-zA-Z]+)',
-        r'i want\s+(\d+)?\s*([a-zA-Z]+)',
-        r'(\d+)\s*([a-zA-Z]+)(?:\s+please)?'
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, user_lower)
-        if match:
-            if match.group(1) and match.group(1).isdigit():
-                quantity = int(match.group(1))
-                item_name = match.group(2)
-            else:
-                item_name = match.group(2) if match.group(2) else match.group(1)
-            break
-    if not item_name:
-        for item in grocery_prices.get("fruits", {}):
-            if item in user_lower:
-                item_name = item
-                break
-    if not item_name:
-        for item in grocery_prices.get("vegetables", {}):
-            if item in user_lower:
-                item_name = item
-                break
-    return item_name, quantity
+def extract_cart_info_from_prompt(user_prompt: str, analysis=None):
+    """
+    First (item_name, quantity) in the utterance. item_name is canonical when the catalog knows
+    it, otherwise the spoken word ("3 dragonfruit") so the caller can say what wasn't found.
+    """
+    index = catalog_store.current.index
+    if analysis is None:
+        analysis = nlu.analyze(user_prompt, index)
+    for segment in analysis.segments:
+        if segment.items:
+            return segment.items[0], segment_quantity(segment, segment.items[0])
+    # misheard names from speech ("bananna", "brocoli")
+    item_name, _ = index.spot(analysis.text)
+    if item_name:
+        return item_name, 1
+    if "order" in analysis.cues or any(seg.quantity is not None for seg in analysis.segments):
+        for segment in analysis.segments:
+            word = nlu.unknown_item_word(segment)
+            if word:
+                return word, segment.quantity if segment.quantity is not None else 1
+    return None, 1
+
+
+def render_cart_reply(cart: dict) -> str:
+    items = cart.get("items", [])
+    if not items:
+        return "Your cart is empty."
+    lines = []
+    for it in items:
+        qty = it.get("quantity", 1)
+        price = float(it.get("price", 0))
+        total = float(it.get("total", price * qty))
+        amount = format_quantity(qty, it.get("unit", "kg"))
+        lines.append(f"- {amount} {it.get('item', 'Unknown')} - Rs{price} x {qty} = Rs{total}")
+    lines_text = "\n".join(lines)
+    return f"Here are the items in your cart:\n{lines_text}\nSubtotal: Rs{cart.get('subtotal', 0)}"
+
+
+def price_reply(item_names) -> str:
+    """Price answer for one or more item names"""
+    known, lines = 0, []
+    for item_name in item_names:
+        price, _ = get_item_price(item_name)
+        if not price:
+            lines.append(f"Sorry, I don't have a price for {item_name}.")
+            continue
+        name = catalog_store.current.index.resolve(item_name) or item_name
+        lines.append(f"{name.capitalize()} costs Rs{price} per {per_unit(pricing_unit(name))}.")
+        known += 1
+    if known:
+        lines.append("Would you like to add " + ("it" if known == 1 else "them") + " to the cart?")
+    return " ".join(lines)
+
+
+def describe_items(added) -> str:
+    """[("apple", 2), ("milk", 1)] -> '2kg of apple and 1L of milk'"""
+    parts = [f"{format_quantity(qty, pricing_unit(name))} of {name}" for name, qty in added]
+    return parts[0] if len(parts) == 1 else ", ".join(parts[:-1]) + " and " + parts[-1]
+
+
+def local_reply(intent, user_lower: str, cart_update_msg: str = "", item_names=()):
+    """Template answer for a confidently classified turn, or None if the model is needed"""
+    if intent.name == "add_item":
+        # cart_update_msg is prepended to the reply by the caller
+        return "Anything else?" if cart_update_msg else None
+    if intent.name == "price_query" and intent.item:
+        return price_reply(item_names or [intent.item])
+    if intent.name == "greeting":
+        if user_lower.startswith("thank"):
+            return "You're welcome! Anything else for your cart?"
+        if user_lower.startswith("bye"):
+            return "Goodbye! Your cart is saved."
+        return "Hi! Tell me what you'd like to add to your cart, or ask me for a price."
+    return None
+
+
+def category_reply(categories) -> str:
+    index = catalog_store.current.index
+    lines = []
+    for category in categories:
+        rows = index.category_items(category, limit=10)
+        listed = ", ".join(f"{name} Rs{price}/{pricing_unit(name)}" for name, price, _ in rows)
+        lines.append(f"{category.capitalize()}: {listed}.")
+    return " ".join(lines) + " What would you like to add?"
+
+
+def fallback_reply(user_prompt: str, intent, cart_updated: bool = False, item_names=(), analysis=None) -> str:
+    """Best local answer when the model is unavailable, failing or too slow"""
+    words = set(analysis.words) if analysis is not None else set(user_prompt.lower().split())
+    if intent.name == "price_query" and not (intent.item or item_names):
+        return "Which item would you like the price for?"
+    if item_names or intent.name == "price_query":
+        # items already added are confirmed by the cart update message; otherwise quote what was named
+        return "Anything else?" if cart_updated else price_reply(item_names or [intent.item])
+    categories = mentioned_categories(catalog_store.current.index, words)
+    if categories:
+        return category_reply(categories)
+    if cart_updated:
+        return "I've updated your cart."
+    if words & {"cart", "basket", "total", "bill", "subtotal"}:
+        return render_cart_reply(session.get("shopping_cart", {}))
+    return ("I can't reach the assistant right now, but I can still add items, tell you prices "
+            "or read out your cart.")
 
 
 def save_session_to_file():
-    """Write session snapshot to ./saved_sessions/{session_id}.json"""
+    """Append this session's changes since its last save to ./saved_sessions/{session_id}.jsonl"""
     try:
         init_session()
-        filename = os.path.join("saved_sessions", f"{session['session_id']}.json")
-        payload = {
-            "session_id": session["session_id"],
-            "shopping_cart": session.get("shopping_cart", {}),
-            "chat_history": session.get("chat_history", []),
-            "user_context": session.get("user_context", {}),
-            "saved_at": datetime.now().isoformat()
-        }
-        with open(filename, "w") as fh:
-            json.dump(payload, fh, indent=2, default=str)
+        filename = saved_sessions.record(session, keep=CHAT_HISTORY_WINDOW)
         print(f"💾 Session saved to {filename}")
         return filename
     except Exception as e:
@@ -265,8 +489,316 @@ def home():
     return jsonify({"message": "Grocery AI Assistant", "status": "ok"})
 
 
+def apply_order(entries, unmatched=()) -> str:
+    """Add parsed (item, quantity) entries in one cart mutation; returns the cart update message"""
+    added, missing = add_items_to_cart(entries)
+    missing += list(unmatched)
+    if not added:
+        return ""
+    cart_update_msg = f"Added {describe_items(added)} to your shopping cart."
+    if missing:
+        cart_update_msg += f" I couldn't find {', '.join(missing)}."
+    remember_order(added)
+    return cart_update_msg
+
+
+def remember_order(added):
+    now = datetime.now().isoformat()
+    for name, qty in added:
+        session["user_context"]["last_order_items"].append({
+            "item": name,
+            "quantity": qty,
+            "timestamp": now
+        })
+    if len(session["user_context"]["last_order_items"]) > 10:
+        session["user_context"]["last_order_items"] = session["user_context"]["last_order_items"][-10:]
+
+
+def apply_model_actions(raw_actions) -> str:
+    """
+    Check the model's cart actions against the catalog and apply them in one cart mutation;
+    returns the cart update message.
+    """
+    init_session()
+    cart = session["shopping_cart"]
+    index = catalog_store.current.index
+    actions, rejected = cart_actions.validate(raw_actions, index)
+    metrics.incr("structured_actions", len(actions))
+    if rejected:
+        metrics.incr("structured_actions_rejected", len(rejected))
+    lines = {it["item"].lower(): it for it in cart["items"]}
+    added, changed, removed = [], [], []
+    for action in actions:
+        line = lines.get(action.item.lower())
+        if action.op == "remove":
+            if line is not None:
+                del lines[action.item.lower()]
+                removed.append(action.item)
+        elif action.op in ("add", "set"):
+            if line is None:
+                price, category = index.get(action.item)
+                line = lines[action.item.lower()] = {
+                    "item": action.item, "quantity": 0, "unit": pricing_unit(action.item), "price": price,
+                    "category": category, "total": 0}
+            quantity = line["quantity"] + action.quantity if action.op == "add" else action.quantity
+            line["quantity"] = round(quantity, 3)
+            line["total"] = round(line["quantity"] * line["price"], 2)
+            (added if action.op == "add" else changed).append((action.item, action.quantity))
+    parts = []
+    if added:
+        parts.append(f"Added {describe_items(added)} to your shopping cart.")
+        remember_order(added)
+    if changed:
+        parts.append(f"Your cart now has {describe_items(changed)}.")
+    if removed:
+        parts.append(f"Removed {', '.join(removed)} from your cart.")
+    if rejected:
+        parts.append(f"I couldn't find {', '.join(rejected)}.")
+    if added or changed or removed:
+        # dict order keeps existing lines in place and new ones at the end
+        cart["items"] = list(lines.values())
+        touch_cart(cart)
+        session.modified = True
+    return " ".join(parts)
+
+
+class Turn(NamedTuple):
+    cart_update_msg: str
+    ai_text: str           # reply when answered without the model, else None
+    prompt_for_model: str  # set when the model has to be asked
+    cache_key: tuple       # response cache key for storing the model's reply
+    source: str            # local / cache / fallback / model
+    fallback: str = None   # local answer used if the model fails or misses the deadline
+    pending: tuple = None  # (entries, unmatched) parsed locally but not applied; used if the model isn't
+    structured: bool = False  # the model is asked for reply + cart actions
+    flight_key: tuple = None  # identical model calls in flight share one (see singleflight.prompt_key)
+
+
+def start_turn(user_prompt: str, structured: bool = False) -> Turn:
+    """
+    Everything an /ai turn does before the model: log the user message, parse and classify the
+    utterance, apply cart changes and consult the response cache. Either ai_text or
+    prompt_for_model is set on the returned Turn. With structured, a cart change in a turn that
+    goes to the model is left to the model's actions (see cart_actions).
+    """
+    print("\n" + "=" * 60)
+    print(f"📥 NEW REQUEST - Session: {session['session_id'][:8]}")
+    print(f"📝 User prompt: {user_prompt}")
+    print(f"🛒 Current cart before: {len(session['shopping_cart']['items'])} items")
+
+    # store user message in history
+    session["chat_history"].append({
+        "role": "user",
+        "message": user_prompt,
+        "timestamp": datetime.now().isoformat()
+    })
+
+    user_lower = user_prompt.lower()
+
+    cart_update_msg = ""
+    catalog = catalog_store.current
+    index = catalog.index
+    # one tokenizer pass: intent cues, quantities and item spans
+    analysis = nlu.analyze(user_prompt, index)
+    if analysis.truncated:
+        metrics.incr("nlu_truncated")
+    # every item named in the utterance ("2 kg apples, 1 kg onions and milk")
+    parsed_items, unmatched_items = parse_items(analysis, index)
+    if parsed_items:
+        cart_item, cart_quantity = parsed_items[0].item, parsed_items[0].quantity
+        known_item = cart_item
+    else:
+        cart_item, cart_quantity = extract_cart_info_from_prompt(user_prompt, analysis)
+        known_item = cart_item if cart_item and index.alias(cart_item) else None
+    item_names = [p.item for p in parsed_items] or ([known_item] if known_item else [])
+    intent = intents.classify(analysis, known_item or cart_item, cart_quantity, item_known=known_item is not None)
+    confident = intent.confidence >= INTENT_CONFIDENCE_THRESHOLD
+    metrics.incr("ai_turns")
+    metrics.incr(f"intent_{intent.name}")
+    print(f"🎯 Intent: {intent.name} ({intent.confidence:.2f})")
+
+    ai_text = None
+    pending = None
+    if intent.name == "view_cart":
+        ai_text = render_cart_reply(session.get("shopping_cart", {}))
+    elif intent.name == "clear_cart" and confident:
+        update_shopping_cart("clear")
+        ai_text = "Your cart is now empty."
+    elif intent.name == "remove_item" and confident:
+        success, msg = update_shopping_cart("remove", intent.item)
+        ai_text = msg
+    else:
+        # the remove half of "add apples and remove onions" is not part of the order
+        removing = intents.removed_items(analysis)
+        ordered = [p for p in parsed_items if p.item not in removing]
+        if intents.wants_to_order(analysis) and (ordered or (cart_item and not parsed_items)):
+            entries = [(p.item, p.quantity) for p in ordered] or [(cart_item, cart_quantity)]
+            if structured and not confident:
+                # the model's actions decide this turn's cart change; the local parse is kept in
+                # case the model can't be asked
+                pending = (entries, unmatched_items)
+            else:
+                cart_update_msg = apply_order(entries, unmatched_items)
+        if confident:
+            ai_text = local_reply(intent, user_lower, cart_update_msg, item_names)
+
+    if ai_text is not None:
+        metrics.incr("model_bypassed")
+        return Turn(cart_update_msg, ai_text, None, None, "local")
+
+    key = cache_key(analysis, catalog.version, session["shopping_cart"], index.category_names())
+    cached = response_cache.get(key)
+    if cached is not None:
+        print("♻️ Reply served from response cache")
+        return Turn(cart_update_msg, cached, None, None, "cache", pending=pending)
+
+    grocery_context = build_catalog_context(user_prompt)
+    conversation_context = build_conversation_context()
+    instructions = cart_actions.PROMPT_INSTRUCTIONS if structured else "Respond concisely."
+    prompt_for_model = f"""You are GroceryBot.
+Grocery prices:
+{grocery_context}
+Context: {conversation_context}
+User: "{user_prompt}"
+{instructions}
+"""
+    fallback = fallback_reply(user_prompt, intent, bool(cart_update_msg or pending), item_names, analysis)
+    if not model:
+        return Turn(cart_update_msg, fallback, None, None, "fallback", pending=pending)
+    if model_breaker.is_open():
+        metrics.incr("breaker_fast_fails")
+        return Turn(cart_update_msg, fallback, None, None, "breaker_open", pending=pending)
+    if model_limiter.in_brownout():
+        metrics.incr("brownout_turns")
+        return Turn(cart_update_msg, fallback, None, None, "brownout", pending=pending)
+    return Turn(cart_update_msg, None, prompt_for_model, key, "model", fallback, pending, structured,
+                prompt_key(prompt_for_model, catalog.version))
+
+
+def cache_late_reply(key):
+    """Callback for a model call abandoned at the deadline: keep its answer for the next asker"""
+    def _store(text):
+        try:
+            response_cache.put(key, clean_text(text))
+        except Exception as e:
+            print("Late model reply unusable:", e)
+    return _store
+
+
+def admit_model_call(turn_deadline) -> bool:
+    """
+    Take a model slot and pass the circuit breaker; returns True for a half-open probe call.
+    Raises limiter.Overloaded, limiter.QueueTimeout or breaker.BreakerOpen instead.
+    """
+    model_limiter.acquire(turn_deadline.remaining())
+    try:
+        probe = model_breaker.acquire()
+    except breaker.BreakerOpen:
+        model_limiter.release()
+        raise
+    metrics.incr("model_calls")
+    return probe
+
+
+def model_reply(turn: Turn, raw):
+    """Model output -> (cleaned reply, raw cart actions or None); caches replies that change nothing"""
+    if not turn.structured:
+        reply, actions = clean_text(raw), None
+    else:
+        reply, actions = cart_actions.parse_reply(raw)
+        reply = clean_text(reply)
+        metrics.incr("structured_turns")
+    if not actions:
+        response_cache.put(turn.cache_key, reply)
+    return reply, actions
+
+
+def ask_model(turn: Turn, turn_deadline):
+    """
+    Blocking model call for a turn, shared with identical turns in flight. Returns the raw
+    output: reply text, or for a structured turn the respond() arguments (see model_reply).
+    """
+    generate = model.generate_structured if turn.structured else model.generate
+    # a late plain reply still fills the cache; a late structured one may carry cart actions
+    on_late_result = None if turn.structured else cache_late_reply(turn.cache_key)
+
+    def _call():
+        probe = admit_model_call(turn_deadline)
+        started = time.monotonic()
+        try:
+            # the slot is held until the call really ends, even one abandoned at the deadline
+            raw = deadline.call(lambda: generate(turn.prompt_for_model), turn_deadline,
+                                on_late_result=on_late_result, on_done=model_limiter.release)
+        except Exception:
+            model_breaker.record(False, time.monotonic() - started, probe)
+            raise
+        model_breaker.record(True, time.monotonic() - started, probe)
+        return raw
+    return model_flights.do(turn.flight_key, _call, timeout=turn_deadline.remaining())
+
+
+def model_failed(e: Exception) -> str:
+    """Log a failed, refused or timed-out model call; returns the history source label"""
+    if isinstance(e, breaker.BreakerOpen):
+        return "breaker_open"
+    if isinstance(e, limiter.Overloaded):
+        metrics.incr("brownout_turns")
+        return "brownout"
+    if isinstance(e, TimeoutError):
+        metrics.incr("model_deadline_exceeded")
+        print("⏱️ Model missed the turn deadline — answering locally")
+        return "deadline"
+    metrics.incr("model_errors")
+    print("Model generation error:", e)
+    return "error"
+
+
+def finish_turn(turn: Turn, reply: str, source: str, actions=None) -> dict:
+    """
+    Apply the model's cart actions (or, if the model wasn't used, a deferred local parse), prefix
+    the cart update, log the assistant reply and persist the session; returns the /ai payload.
+    """
+    cart_update_msg = turn.cart_update_msg
+    if actions:
+        cart_update_msg = apply_model_actions(actions)
+    elif turn.pending and source != "model":
+        cart_update_msg = apply_order(*turn.pending)
+    cleaned = cart_update_msg + "\n\n" + reply if cart_update_msg else reply
+    session["chat_history"].append({
+        "role": "assistant",
+        "message": cleaned,
+        "timestamp": datetime.now().isoformat(),
+        # lets the response cache be warmed from saved sessions with replies that are still valid
+        "source": source,
+        "catalog_version": catalog_store.current.version,
+    })
+
+    session.modified = True
+    save_session_to_file()
+
+    print(f"📤 AI Response: {cleaned[:200]}...")
+    print(f"🛒 Current cart after: {len(session['shopping_cart']['items'])} items")
+    print("=" * 60)
+    return {
+        "success": True,
+        "response": cleaned,
+        "session_id": session["session_id"],
+        "cart_summary": cart_summary()
+    }
+
+
+def cart_summary() -> dict:
+    return {
+        "total_items": session["shopping_cart"]["total_items"],
+        "subtotal": session["shopping_cart"]["subtotal"],
+        "items": session["shopping_cart"]["items"],
+        "item_count": len(session["shopping_cart"]["items"])
+    }
+
+
 @app.route("/ai", methods=["POST"])
 def ai_endpoint():
+    turn_deadline = deadline.Deadline(AI_DEADLINE_SECONDS, AI_DEADLINE_RESERVE)
     try:
         init_session()
         data = request.get_json(silent=True) or {}
@@ -274,146 +806,161 @@ def ai_endpoint():
         if not user_prompt:
             return jsonify({"success": False, "error": "user_prompt required"}), 400
 
-        print("\n" + "=" * 60)
-        print(f"📥 NEW REQUEST - Session: {session['session_id'][:8]}")
-        print(f"📝 User prompt: {user_prompt}")
-        print(f"🛒 Current cart before: {len(session['shopping_cart']['items'])} items")
+        turn = start_turn(user_prompt, structured=STRUCTURED_REPLIES)
+        source = turn.source
+        reply = clean_text(turn.ai_text) if turn.ai_text is not None else None
+        actions = None
+        if turn.prompt_for_model is not None:
+            try:
+                reply, actions = model_reply(turn, ask_model(turn, turn_deadline))
+            except Exception as e:
+                reply, source = turn.fallback, model_failed(e)
+
+        return jsonify(finish_turn(turn, reply, source, actions))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        # store user message in history
-        session["chat_history"].append({
-            "role": "user",
-            "message": user_prompt,
-            "timestamp": datetime.now().isoformat()
-        })
 
-        user_lower = user_prompt.lower()
-
-        # detect cart inquiry intent
-        cart_query_patterns = [
-            r'what.*in.*my.*cart',
-            r'what.*in.*the.*cart',
-            r'what.*are.*in.*my.*cart',
-            r'what.*items.*in.*my.*cart',
-            r'list.*cart',
-            r'show.*cart'
-        ]
-        is_cart_query = any(re.search(pat, user_lower) for pat in cart_query_patterns)
-
-        cart_update_msg = ""
-        cart_item, cart_quantity = extract_cart_info_from_prompt(user_prompt)
-        wants_to_order = any(k in user_lower for k in [
-            "yes", "add", "order", "i want", "put in cart", "add to cart",
-            "please add", "add it", "i need", "give me", "put it", "include", "buy", "purchase", "get me"
-        ])
-
-        if is_cart_query:
-            cart = session.get("shopping_cart", {})
-            items = cart.get("items", [])
-            if not items:
-                ai_text = "Your cart is empty."
-            else:
-                lines = []
-                for it in items:
-                    qty = int(it.get("quantity", 1))
-                    price = float(it.get("price", 0))
-                    total = float(it.get("total", price * qty))
-                    lines.append(f"- {qty}kg {it.get('item', 'Unknown')} - Rs{price} x {qty} = Rs{total}")
-                lines_text = "\n".join(lines)
-                ai_text = f"Here are the items in your cart:\n{lines_text}\nSubtotal: Rs{cart.get('subtotal', 0)}"
-        else:
-            if wants_to_order and cart_item:
-                success, msg = update_shopping_cart("add", cart_item, cart_quantity)
-                if success:
-                    cart_update_msg = f"Added {cart_quantity}kg of {cart_item} to your shopping cart."
-                    session["user_context"]["last_order_items"].append({
-                        "item": cart_item,
-                        "quantity": cart_quantity,
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    if len(session["user_context"]["last_order_items"]) > 10:
-                        session["user_context"]["last_order_items"] = session["user_context"]["last_order_items"][-10:]
-
-            grocery_context = json.dumps(grocery_prices, indent=2)
-            conversation_context = build_conversation_context()
-            prompt_for_model = f"""You are GroceryBot.
-Grocery prices: {grocery_context}
-Context: {conversation_context}
-User: "{user_prompt}"
-Respond concisely.
-"""
+@app.route("/ai/stream", methods=["POST"])
+def ai_stream_endpoint():
+    """
+    Same turn as /ai, answered as server-sent events:
+      event: cart   {"message", "cart_summary"}   first, before any text
+      event: chunk  {"text"}                      one cleaned sentence at a time
+      event: done   {"response", "session_id"}    the full reply, as /ai would return it
+    Clients speak cart.message, then each chunk as it arrives. With a deadline, a model that
+    hasn't started answering in time is replaced by the local answer, and one that is still
+    talking is cut off after the last complete sentence.
+    """
+    turn_deadline = deadline.Deadline(AI_DEADLINE_SECONDS, AI_DEADLINE_RESERVE)
+    init_session()
+    data = request.get_json(silent=True) or {}
+    user_prompt = (data.get("user_prompt", "") or "").strip()
+    if not user_prompt:
+        return jsonify({"success": False, "error": "user_prompt required"}), 400
+
+    turn = start_turn(user_prompt)
+    metrics.incr("stream_turns")
+    # the cart and user message are stored now; the response is sent before the body streams,
+    # so the reply itself is persisted explicitly once generation finishes
+    session.modified = True
 
-            ai_text = "(no model configured)"
-            if model:
-                try:
-                    response = model.generate_content(
-                        prompt_for_model,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.6,
-                            top_p=0.9,
-                            top_k=40,
-                            max_output_tokens=300,
-                        )
-                    )
-                    ai_text = response.text
-                except Exception as e:
-                    print("Model generation error:", e)
-                    ai_text = "Sorry, I couldn't generate a response right now."
-            else:
-                if any(w in user_lower for w in ["price", "cost", "how much", "rate"]):
-                    item_candidate, _ = extract_cart_info_from_prompt(user_prompt)
-                    if item_candidate:
-                        price, _ = get_item_price(item_candidate)
-                        if price:
-                            ai_text = f"{item_candidate.capitalize()} costs Rs{price} per kg. Would you like to add it to the cart?"
-                        else:
-                            ai_text = f"Sorry, I don't have a price for {item_candidate}."
-                    else:
-                        ai_text = "Which item would you like the price for?"
-                else:
-                    if cart_update_msg:
-                        ai_text = f"{cart_update_msg} I've updated your cart."
+    @stream_with_context
+    def events():
+        yield sse("cart", {"message": turn.cart_update_msg, "cart_summary": cart_summary()})
+        chunker = SentenceChunker(clean_text)
+        sent = []
+        first = True
+
+        def emit(chunks):
+            nonlocal first
+            for chunk in chunks:
+                if first:
+                    metrics.set_gauge("stream_first_chunk_ms", turn_deadline.elapsed_ms())
+                    first = False
+                sent.append(chunk)
+                yield sse("chunk", {"text": chunk})
+
+        source = turn.source
+        if turn.prompt_for_model is None:
+            yield from emit(chunker.feed(turn.ai_text))
+        else:
+            probe = started = first_piece = None
+            completed = failed = False
+            try:
+                probe = admit_model_call(turn_deadline)
+                started = time.monotonic()
+                pieces = deadline.iterate(lambda: model.stream(turn.prompt_for_model), turn_deadline,
+                                          on_done=model_limiter.release)
+                for piece in pieces:
+                    first_piece = first_piece or time.monotonic() - started
+                    yield from emit(chunker.feed(piece))
+                completed = True
+                yield from emit(chunker.flush())
+                response_cache.put(turn.cache_key, " ".join(sent))
+            except Exception as e:
+                # a reply cut off at the deadline keeps what was already spoken
+                failed = True
+                source = model_failed(e)
+                chunker.discard()
+                if not sent:
+                    yield from emit([turn.fallback])
+            finally:
+                # also runs when the client hangs up (GeneratorExit), so a probe is never left
+                # outstanding; a stream is judged on how long its first piece took
+                if started is not None:
+                    if completed or failed or first_piece:
+                        model_breaker.record(not failed, first_piece or time.monotonic() - started, probe)
                     else:
-                        ai_text = f"I heard: {user_prompt}"
+                        model_breaker.release(time.monotonic() - started, probe)
+        yield from emit(chunker.flush())
 
-        cleaned = clean_text(ai_text)
-        if cart_update_msg:
-            cleaned = cart_update_msg + "\n\n" + cleaned
+        payload = finish_turn(turn, " ".join(sent), source)
+        app.session_interface.save_session(app, session, Response())
+        yield sse("done", {"response": payload["response"], "session_id": payload["session_id"]})
 
-        # log assistant message
-        session["chat_history"].append({
-            "role": "assistant",
-            "message": cleaned,
-            "timestamp": datetime.now().isoformat()
-        })
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-        session.modified = True
-        save_session_to_file()
 
-        print(f"📤 AI Response: {cleaned[:200]}...")
-        print(f"🛒 Current cart after: {len(session['shopping_cart']['items'])} items")
-        print("=" * 60)
-
-        return jsonify({
-            "success": True,
-            "response": cleaned,
-            "session_id": session["session_id"],
-            "cart_summary": {
-                "total_items": session["shopping_cart"]["total_items"],
-                "subtotal": session["shopping_cart"]["subtotal"],
-                "items": session["shopping_cart"]["items"],
-                "item_count": len(session["shopping_cart"]["items"])
-            }
-        })
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"success": False, "error": str(e)}), 500
+@app.route("/status", methods=["GET"])
+def status():
+    """Health of the model path: backend, circuit breaker, concurrency limiter"""
+    return jsonify({
+        "success": True,
+        "model": {
+            "backend": model.name if model is not None else None,
+            "breaker": model_breaker.status(),
+            "in_flight": model_limiter.in_flight,
+            "queue_depth": model_limiter.queue_depth,
+            "brownout": model_limiter.in_brownout(),
+        },
+        "catalog_version": catalog_store.current.version,
+    })
+
+
+@app.route("/catalog", methods=["GET"])
+def catalog_info():
+    catalog = catalog_store.current
+    return jsonify({
+        "success": True,
+        "version": catalog.version,
+        "loaded_at": catalog.loaded_at,
+        "item_count": len(catalog.index),
+        "reload_count": catalog_store.reload_count,
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    data = metrics.snapshot()
+    data["derived"] = {
+        # share of the full price list that actually reaches the prompt
+        "prompt_catalog_ratio": metrics.ratio("prompt_catalog_tokens_sent", "prompt_catalog_tokens_full"),
+        # share of /ai turns answered locally without a model call
+        "model_bypass_rate": metrics.ratio("model_bypassed", "ai_turns"),
+        # share of model-bound turns answered from the response cache
+        "response_cache_hit_rate": metrics.ratio(
+            "response_cache_hits", ("response_cache_hits", "response_cache_misses")),
+        # share of model-bound turns that shared another turn's model call
+        "coalesce_rate": metrics.ratio("coalesced_requests", ("coalesced_requests", "model_calls")),
+        # share of session loads served from the worker's front cache (sqlite session backend)
+        "session_cache_hit_rate": metrics.ratio(
+            "session_cache_hits", ("session_cache_hits", "session_cache_misses")),
+        # share of requests whose session was left as it was instead of being rewritten
+        "session_write_skip_rate": metrics.ratio(
+            "session_writes_skipped", ("session_writes_skipped", "session_writes", "session_refreshes")),
+        # model-bound turns are being answered locally because the model queue overflowed
+        "brownout_active": model_limiter.in_brownout(),
+    }
+    return jsonify({"success": True, **data})
 
 
 @app.route("/cart", methods=["GET"])
 def get_cart():
     init_session()
-    session.modified = True
     return jsonify({
         "success": True,
         "session_id": session["session_id"],
@@ -422,13 +969,33 @@ def get_cart():
     })
 
 
+def request_quantity(data: dict):
+    """Quantity from a /cart/add payload, converted from its optional "unit" to the pricing unit"""
+    quantity = float(data.get("quantity", 1))
+    unit = UNITS.get(str(data.get("unit", "")).lower(), ("",))[0]
+    name = catalog_store.current.index.resolve(data.get("item_name") or "") or ""
+    converted = to_pricing_unit(quantity, unit, name) if unit else None
+    quantity = converted if converted is not None else quantity
+    return int(quantity) if float(quantity).is_integer() else quantity
+
+
 @app.route("/cart/add", methods=["POST"])
 def add_to_cart_route():
     try:
         init_session()
         data = request.get_json(silent=True) or {}
+        # either a single item_name/quantity or a batch: {"items": [{"item_name": ..., "quantity": ...}, ...]}
+        # an optional "unit" ("g", "dozen", ...) is converted to the item's pricing unit
+        if data.get("items"):
+            entries = [(it.get("item_name"), request_quantity(it)) for it in data["items"]]
+            added, missing = add_items_to_cart(entries)
+            save_session_to_file()
+            if not added:
+                return jsonify({"success": False, "error": f"Items not found: {', '.join(map(str, missing))}"}), 400
+            return jsonify({"success": True, "message": f"Added {describe_items(added)} to cart",
+                            "missing": missing, "cart": session["shopping_cart"]})
         item_name = data.get("item_name")
-        quantity = int(data.get("quantity", 1))
+        quantity = request_quantity(data)
         if not item_name:
             return jsonify({"success": False, "error": "item_name required"}), 400
         success, msg = update_shopping_cart("add", item_name, quantity)
@@ -479,7 +1046,7 @@ def download_pdf():
             # ASCII-friendly line: '-' instead of bullet, 'Rs' instead of rupee symbol
             item_name = safe_text(it.get('item', 'Unknown'))
             price = it.get('price', 0)
-            qty = it.get('quantity', 1)
+            qty = format_quantity(it.get('quantity', 1), it.get('unit', 'kg'))
             line = f"- {item_name} - Rs{price} x {qty} = Rs{item_total}"
             pdf.multi_cell(0, 7, safe_text(line))
         pdf.ln(4)
@@ -503,16 +1070,9 @@ def download_pdf():
 
         try:
             meta = {"generated_pdf": os.path.basename(filename), "generated_at": datetime.now().isoformat()}
-            ss = os.path.join("saved_sessions", f"{session['session_id']}.json")
-            if os.path.exists(ss):
-                with open(ss, "r+") as fh:
-                    data = json.load(fh)
-                    data.setdefault("generated_files", []).append(meta)
-                    fh.seek(0)
-                    json.dump(data, fh, indent=2, default=str)
-                    fh.truncate()
+            saved_sessions.add_file(session["session_id"], meta)
         except Exception as e:
-            print("Could not append PDF metadata to session file:", e)
+            print("Could not append PDF metadata to session log:", e)
 
         return send_file(filename, as_attachment=True, download_name=f"grocery-{datetime.now().strftime('%Y%m%d-%H%M%S')}.pdf", mimetype="application/pdf")
     except Exception as e:
@@ -523,8 +1083,28 @@ def download_pdf():
 
 @app.route("/history", methods=["GET"])
 def get_history():
+    """
+    Chat history. Without arguments: the messages still in the session. ?before=N&limit=M pages
+    back through the whole conversation: up to M messages ending before position N (0 = the
+    first message ever), read from saved_sessions once they are older than the session window.
+    """
     init_session()
-    return jsonify({"success": True, "session_id": session["session_id"], "history": session.get("chat_history", [])})
+    history, offset = session["chat_history"], session.get(OFFSET_KEY, 0)
+    total = offset + len(history)
+    if "before" not in request.args and "limit" not in request.args:
+        start, page = offset, history
+    else:
+        try:
+            end = max(0, min(int(request.args.get("before", total)), total))
+            limit = max(1, min(int(request.args.get("limit", 20)), HISTORY_PAGE_LIMIT))
+        except ValueError:
+            return jsonify({"success": False, "error": "before and limit must be integers"}), 400
+        start = max(0, end - limit)
+        page = history[max(start, offset) - offset:end - offset] if end > offset else []
+        if start < offset:
+            page = saved_sessions.messages(session["session_id"], start, min(end, offset)) + page
+    return jsonify({"success": True, "session_id": session["session_id"], "history": page,
+                    "start": start, "total": total, "has_more": start > 0})
 
 
 @app.route("/session/reset", methods=["POST"])
@@ -537,7 +1117,7 @@ def reset_session():
 if __name__ == "__main__":
     print("=" * 70)
     print("Grocery Assistant API starting")
-    print(f"Session dir: {app.config['SESSION_FILE_DIR']}")
+    print(f"Sessions: {SESSION_DB_PATH if SESSION_BACKEND == 'sqlite' else app.config['SESSION_FILE_DIR']}")
     print("Saved sessions dir: ./saved_sessions")
     print("PDFs dir: ./tmp_pdfs")
     print("=" * 70)
@@ -0,0 +1,40 @@
+"""Process-wide counters and gauges, served as JSON by GET /metrics"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def incr(name: str, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def get(name: str, default=0):
+    with _lock:
+        return _counters.get(name, _gauges.get(name, default))
+
+
+def ratio(numerator: str, denominator):
+    """numerator / denominator counters (a tuple of names is summed), or None before the first event"""
+    names = (denominator,) if isinstance(denominator, str) else denominator
+    with _lock:
+        den = sum(_counters.get(name, 0) for name in names)
+        return round(_counters.get(numerator, 0) / den, 4) if den else None
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
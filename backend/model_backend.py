@@ -0,0 +1,253 @@
+"""
+Model backends the /ai routes call through.
+
+Every backend answers a prompt with plain text, four ways: generate / stream (blocking, for
+the threaded server) and generate_async / stream_async (for the ASGI mode). Streams yield text
+pieces as they arrive. generate_structured(_async) asks for a reply plus cart actions (see
+cart_actions) and returns the respond() arguments as a dict, or text holding the same JSON.
+
+    gemini  Google Gemini (needs GEMINI_API_KEY and google-generativeai)
+    fake    local stand-in with seeded latency, errors and streaming, for load tests without network
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+import cart_actions
+
+# Optional Gemini imports (guarded)
+try:
+    import google.generativeai as genai
+except Exception:
+    genai = None
+
+
+class ModelError(RuntimeError):
+    """A failed model call (the fake backend raises this for its injected errors)"""
+
+
+class ModelBackend:
+    name = "base"
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str):
+        raise NotImplementedError
+
+    async def generate_async(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.generate, prompt)
+
+    async def stream_async(self, prompt: str):
+        # fallback for backends without a native async stream: whole reply as one piece
+        yield await self.generate_async(prompt)
+
+    def generate_structured(self, prompt: str):
+        # the prompt carries the JSON instructions; the caller parses the text
+        return self.generate(prompt)
+
+    async def generate_structured_async(self, prompt: str):
+        return await self.generate_async(prompt)
+
+
+# ----------------- Gemini -----------------
+class GeminiBackend(ModelBackend):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash"):
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        # tools are fixed per model object in this client version
+        self.structured_model = genai.GenerativeModel(model_name, tools=[cart_actions.RESPOND_TOOL])
+        self.config = genai.types.GenerationConfig(
+            temperature=0.6,
+            top_p=0.9,
+            top_k=40,
+            max_output_tokens=300,
+        )
+
+    def generate(self, prompt: str) -> str:
+        return self.model.generate_content(prompt, generation_config=self.config).text
+
+    def stream(self, prompt: str):
+        for piece in self.model.generate_content(prompt, generation_config=self.config, stream=True):
+            yield piece.text
+
+    async def generate_async(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt, generation_config=self.config)
+        return response.text
+
+    async def stream_async(self, prompt: str):
+        response = await self.model.generate_content_async(prompt, generation_config=self.config, stream=True)
+        async for piece in response:
+            yield piece.text
+
+    def generate_structured(self, prompt: str):
+        return self._respond_args(self.structured_model.generate_content(prompt, generation_config=self.config))
+
+    async def generate_structured_async(self, prompt: str):
+        return self._respond_args(
+            await self.structured_model.generate_content_async(prompt, generation_config=self.config))
+
+    @staticmethod
+    def _respond_args(response):
+        """respond() call arguments if the model made one, else its text"""
+        texts = []
+        for part in response.parts:
+            if "function_call" in part and part.function_call.name == "respond":
+                return type(part.function_call).to_dict(part.function_call).get("args") or {}
+            if "text" in part:
+                texts.append(part.text)
+        return "".join(texts)
+
+
+# ----------------- local fake -----------------
+def parse_latency(spec: str):
+    """
+    Latency distribution in milliseconds -> sampler(rng) returning seconds:
+        fixed:800            always 800 ms
+        uniform:200:1500     uniform between 200 and 1500 ms
+        normal:800:200       mean 800, standard deviation 200 (never below 0)
+        lognormal:700:0.5    median 700, sigma 0.5 (a long right tail, like real model latency)
+    """
+    kind, _, args = (spec or "fixed:0").partition(":")
+    try:
+        values = [float(v) for v in args.split(":")] if args else []
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0] / 1000
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(*values) / 1000
+        if kind == "normal" and len(values) == 2:
+            return lambda rng: max(0.0, rng.gauss(*values)) / 1000
+        if kind == "lognormal" and len(values) == 2:
+            return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"bad latency spec {spec!r} (expected fixed:MS, uniform:LO:HI, normal:MEAN:SD or lognormal:MEDIAN:SIGMA)")
+
+
+_QUESTION_RE = re.compile(r'User: "(.*)"')
+_OPENERS = ["Sure.", "Good question!", "Here's what I can tell you.", "Happy to help."]
+_BODIES = [
+    "For {q}, the prices in your list are per kg unless marked otherwise.",
+    "About {q}: fresh stock is in, and you can add any of it to your cart by voice.",
+    "On {q}, I'd pick what's in season, it's usually the best value this week.",
+]
+_CLOSERS = ["Anything else?", "Would you like me to add something to your cart?", "What else can I get you?"]
+# "add 2 kg apples", "remove onions" in the user's message -> the fake's structured actions
+_ACTION_RE = re.compile(r"\b(add|remove)\s+(?:(\d+(?:\.\d+)?)\s*(kg|g|l|ml|dozen)?\s+)?(?:of\s+)?([a-z]+)")
+
+
+class FakeBackend(ModelBackend):
+    """
+    Deterministic stand-in for the model. Each call draws its latency, success and reply from an
+    RNG seeded by (seed, prompt, how many times this prompt was asked before), so the same set
+    of requests gets the same answers and timings whatever order threads run them in.
+    """
+    name = "fake"
+
+    def __init__(self, latency: str = "lognormal:700:0.4", error_rate: float = 0.0, seed: int = 0,
+                 first_piece_share: float = 0.3):
+        # first_piece_share: part of a streamed call's latency spent before the first piece arrives
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.seed = seed
+        self.first_piece_share = first_piece_share
+        self._asked = {}
+        self._lock = threading.Lock()
+
+    def _plan(self, prompt: str):
+        """(latency seconds, fail_after_piece or None, reply pieces) for the next call with this prompt"""
+        digest = hashlib.sha1(prompt.encode()).hexdigest()
+        with self._lock:
+            n = self._asked.get(digest, 0)
+            self._asked[digest] = n + 1
+        rng = random.Random(f"{self.seed}:{digest}:{n}")
+        latency = self.sample_latency(rng)
+        match = _QUESTION_RE.search(prompt)
+        question = (match.group(1) if match else "that").strip().rstrip("?.!") or "that"
+        reply = " ".join([rng.choice(_OPENERS), rng.choice(_BODIES).format(q=question), rng.choice(_CLOSERS)])
+        pieces = [w + " " for w in reply.split()]
+        pieces[-1] = pieces[-1].rstrip()
+        fail_after = rng.randrange(len(pieces)) if rng.random() < self.error_rate else None
+        return latency, fail_after, pieces
+
+    def _steps(self, latency: float, count: int):
+        """Delay before each streamed piece: a first-piece wait, then the rest spread evenly"""
+        first = latency * self.first_piece_share
+        rest = (latency - first) / max(1, count - 1)
+        return [first] + [rest] * (count - 1)
+
+    def generate(self, prompt: str) -> str:
+        latency, fail_after, pieces = self._plan(prompt)
+        time.sleep(latency)
+        if fail_after is not None:
+            raise ModelError("fake model error")
+        return "".join(pieces)
+
+    def stream(self, prompt: str):
+        latency, fail_after, pieces = self._plan(prompt)
+        for i, (delay, piece) in enumerate(zip(self._steps(latency, len(pieces)), pieces)):
+            time.sleep(delay)
+            if i == fail_after:
+                raise ModelError("fake model error mid-stream")
+            yield piece
+
+    async def generate_async(self, prompt: str) -> str:
+        latency, fail_after, pieces = self._plan(prompt)
+        await asyncio.sleep(latency)
+        if fail_after is not None:
+            raise ModelError("fake model error")
+        return "".join(pieces)
+
+    async def stream_async(self, prompt: str):
+        latency, fail_after, pieces = self._plan(prompt)
+        for i, (delay, piece) in enumerate(zip(self._steps(latency, len(pieces)), pieces)):
+            await asyncio.sleep(delay)
+            if i == fail_after:
+                raise ModelError("fake model error mid-stream")
+            yield piece
+
+    def generate_structured(self, prompt: str):
+        return self._structured(prompt, self.generate(prompt))
+
+    async def generate_structured_async(self, prompt: str):
+        return self._structured(prompt, await self.generate_async(prompt))
+
+    @staticmethod
+    def _structured(prompt: str, reply: str) -> str:
+        """The fake's reply as respond() JSON, with add/remove actions read off the user's message"""
+        match = _QUESTION_RE.search(prompt)
+        actions = []
+        for op, amount, unit, item in _ACTION_RE.findall((match.group(1) if match else "").lower()):
+            action = {"op": op, "item": item}
+            if op == "add":
+                action.update(quantity=float(amount or 1), unit=unit or None)
+            actions.append(action)
+        return json.dumps({"reply": reply, "actions": actions})
+
+
+def create(name: str, **options):
+    """
+    Backend by name, or None when it can't be used (the routes then answer locally).
+    options: api_key, model_name for gemini; latency, error_rate, seed for fake.
+    """
+    if name == "fake":
+        return FakeBackend(options.get("latency", "lognormal:700:0.4"), options.get("error_rate", 0.0),
+                           options.get("seed", 0))
+    if name == "gemini":
+        if not options.get("api_key"):
+            print("⚠️ GEMINI_API_KEY not set — model responses will be stubbed.")
+            return None
+        if genai is None:
+            print("⚠️ google-generativeai not installed — model responses will be stubbed.")
+            return None
+        return GeminiBackend(options["api_key"], options.get("model_name", "gemini-2.0-flash"))
+    if name != "none":
+        print(f"⚠️ Unknown MODEL_BACKEND {name!r} — model responses will be stubbed.")
+    return None
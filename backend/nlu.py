@@ -0,0 +1,185 @@
+"""
+Single-pass utterance analysis.
+
+One compiled tokenizer walks the (length-capped) utterance once; a small state machine over
+the tokens collects intent cues, quantities and catalog item spans together. Nothing here uses
+unbounded `.*` gaps, so the cost is linear in the utterance however it is worded.
+"""
+import re
+from typing import NamedTuple
+
+from fuzzy import STOPWORDS
+import quantities
+
+# longer input is truncated before analysis (pasted shopping lists, runaway transcripts)
+MAX_UTTERANCE_CHARS = 1000
+
+TOKEN_RE = re.compile(r"\d*\.\d+|\d+(?:/\d+)?|[a-z]+(?:'[a-z]+)?|[,;&]")
+SEPARATORS = {",", ";", "&", "and", "plus", "also", "then"}
+
+# single-token and two-token cue phrases -> cue name
+CUE_WORDS = {
+    "yes": "order", "add": "order", "order": "order", "include": "order", "buy": "order", "purchase": "order",
+    "price": "price", "prices": "price", "cost": "price", "costs": "price", "rate": "price", "rates": "price",
+    "remove": "remove", "delete": "remove", "drop": "remove", "cancel": "remove",
+    "clear": "clear", "empty": "clear", "reset": "clear",
+    "why": "open", "recipe": "open", "recommend": "open", "suggest": "open", "healthy": "open",
+    "healthier": "open", "better": "open", "compare": "open", "should": "open", "cook": "open",
+    "difference": "open", "which": "open",
+    "not": "negation", "don't": "negation", "dont": "negation", "never": "negation",
+}
+CUE_PAIRS = {
+    ("i", "want"): "order", ("i", "need"): "order", ("give", "me"): "order", ("get", "me"): "order",
+    ("put", "it"): "order", ("put", "in"): "order",
+    ("how", "much"): "price", ("take", "out"): "remove",
+}
+CART_WORDS = {"cart", "basket"}
+GREETING_WORDS = {"hi", "hello", "hey", "thanks", "thank", "you", "ok", "okay", "bye", "there", "bot", "grocerybot"}
+GREETING_STARTS = {"hi", "hello", "hey", "thanks", "thank", "ok", "okay", "bye"}
+# command words skipped when naming an item we could not match
+FILLER_WORDS = {"add", "please", "i", "want", "need", "get", "me", "buy", "order", "some", "of", "to", "my",
+                "cart", "the", "a", "an", "more", "kg", "give", "put", "it", "in", "include", "purchase"}
+
+QUANTITY_WORDS = (set(quantities.NUMBER_WORDS) | set(quantities.SCALE_WORDS) | set(quantities.FRACTION_WORDS)
+                  | set(quantities.COUNT_WORDS))
+
+
+class Segment(NamedTuple):
+    items: tuple       # canonical names spotted in this list segment
+    quantity: float    # None when no amount was spoken
+    unit: str          # canonical spoken unit ("kg", "g", "l", "dozen", ...) or ""
+    words: tuple       # word tokens of the segment
+
+
+class Analysis(NamedTuple):
+    text: str          # lowered, length-capped utterance
+    words: tuple       # word and number tokens
+    cues: frozenset    # order / price / remove / clear / open / negation / view_cart / clear_cart / greeting
+    segments: tuple
+    truncated: bool
+
+
+def analyze(user_prompt: str, index=None, max_chars: int = MAX_UTTERANCE_CHARS) -> Analysis:
+    """Tokenize once and collect cues, quantities and exact catalog item spans in the same pass"""
+    text = (user_prompt or "").lower()
+    truncated = len(text) > max_chars
+    if truncated:
+        text = text[:max_chars]
+    tokens = TOKEN_RE.findall(text)
+    max_words = getattr(index, "max_words", 1) if index is not None else 0
+    # in-memory catalogs find every alias mention up front in one automaton pass; the sqlite
+    # backend falls back to probing word windows against its alias table
+    mentions = index.mentions(tokens) if hasattr(index, "mentions") else None
+
+    cues = set()
+    words = []
+    segments = []
+    seg_items, seg_words, seg_qty, seg_unit = [], [], None, ""
+    saw_what = saw_what_in = saw_list = saw_remove_all = False
+
+    def close_segment():
+        nonlocal seg_items, seg_words, seg_qty, seg_unit
+        if seg_words:
+            last = segments[-1] if segments else None
+            if not seg_items and seg_qty is not None and last and last.items and last.quantity is None:
+                # an amount after its item ("add apples 2 kg", "apples 2 kg, onions 3 kg")
+                segments[-1] = Segment(last.items, seg_qty, seg_unit, last.words + tuple(seg_words))
+            else:
+                segments.append(Segment(tuple(seg_items), seg_qty, seg_unit, tuple(seg_words)))
+        seg_items, seg_words, seg_qty, seg_unit = [], [], None, ""
+
+    i, n = 0, len(tokens)
+    while i < n:
+        tok = tokens[i]
+        if tok in SEPARATORS:
+            close_segment()
+            i += 1
+            continue
+        words.append(tok)
+
+        qty = quantities.parse_quantity(tokens, i)
+        if qty:
+            # a second quantity after an item starts a new segment ("2 kg apples 1 kg onions")
+            if seg_items or seg_qty is not None:
+                close_segment()
+            seg_qty, seg_unit = qty.value, qty.unit
+            span = tokens[i:i + qty.consumed]
+            words.extend(span[1:])
+            seg_words.extend(span)
+            i += qty.consumed
+            continue
+
+        cue = CUE_WORDS.get(tok)
+        if cue:
+            cues.add(cue)
+        if i + 1 < n:
+            cue = CUE_PAIRS.get((tok, tokens[i + 1]))
+            if cue:
+                cues.add(cue)
+        # ordered cart-question cues, replacing what.*in.*my.*cart style patterns
+        if tok in ("what", "what's", "whats"):
+            saw_what = True
+        elif saw_what and tok in ("in", "items"):
+            saw_what_in = True
+        elif tok in ("list", "show"):
+            saw_list = True
+        elif tok in CART_WORDS:
+            if saw_what_in or saw_list:
+                cues.add("view_cart")
+            if "clear" in cues:
+                cues.add("clear_cart")
+        elif "remove" in cues and tok in ("everything", "all"):
+            saw_remove_all = True
+
+        # longest exact catalog name starting here
+        matched = 0
+        if mentions is not None:
+            length, name = mentions.get(i, (0, None))
+            if name:
+                seg_items.append(name)
+                matched = length
+        elif index is not None:
+            for size in range(min(max_words, n - i), 0, -1):
+                window = tokens[i:i + size]
+                if any(t in SEPARATORS for t in window):
+                    continue
+                name = index.alias(" ".join(window))
+                if name:
+                    seg_items.append(name)
+                    matched = size
+                    break
+        if matched > 1:
+            words.extend(tokens[i + 1:i + matched])
+            seg_words.extend(tokens[i:i + matched])
+            i += matched
+            continue
+        seg_words.append(tok)
+        i += 1
+    close_segment()
+
+    if saw_remove_all:
+        cues.add("clear_cart")
+    if words and words[0] in GREETING_STARTS and all(w in GREETING_WORDS for w in words):
+        cues.add("greeting")
+    return Analysis(text, tuple(words), frozenset(cues), tuple(segments), truncated)
+
+
+def has_cue(segment: Segment, cue: str) -> bool:
+    """True when the segment's own words carry the cue ("remove the onions" -> remove)"""
+    words = segment.words
+    if any(CUE_WORDS.get(w) == cue for w in words):
+        return True
+    return any(CUE_PAIRS.get(pair) == cue for pair in zip(words, words[1:]))
+
+
+def unknown_item_word(segment: Segment):
+    """Best guess at the item a segment names when the catalog has no match ("3 dragonfruit")"""
+    for word in segment.words:
+        if word[0].isdigit() or word[0] == "." or word in quantities.UNITS or word in QUANTITY_WORDS:
+            continue
+        if word in FILLER_WORDS or word in STOPWORDS:
+            continue
+        if word in CUE_WORDS or word in GREETING_WORDS:
+            continue
+        return word
+    return None
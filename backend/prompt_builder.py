@@ -0,0 +1,187 @@
+"""Prompt assembly helpers: pick only the catalog rows a turn needs and keep them compact"""
+import json
+import threading
+from collections import OrderedDict
+
+import metrics
+from catalog import name_variants, normalize_name
+from fuzzy import STOPWORDS
+from quantities import format_quantity, pricing_unit
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English/JSON), good enough for budgeting"""
+    return (len(text or "") + 3) // 4
+
+
+_full_tokens_cache = {}
+
+
+def full_catalog_tokens(snapshot) -> int:
+    """Tokens the old `json.dumps(prices, indent=2)` prompt section would cost, cached per catalog version"""
+    cached = _full_tokens_cache.get(snapshot.version)
+    if cached is None:
+        if snapshot.prices:
+            cached = estimate_tokens(json.dumps(snapshot.prices, indent=2))
+        else:
+            # sqlite mode keeps prices on disk; extrapolate from one rendered row per item
+            cached = len(snapshot.index) * estimate_tokens('    "example item": 100,\n') + 8 * len(snapshot.index.category_names())
+        _full_tokens_cache.clear()
+        _full_tokens_cache[snapshot.version] = cached
+    return cached
+
+
+def mentioned_categories(index, words):
+    found = []
+    for category in index.category_names():
+        name = normalize_name(category)
+        if name in words or any(v in words for v in name_variants(name)):
+            found.append(category)
+    return found
+
+
+def select_catalog(index, utterance: str, cart_items=(), recent_items=(), token_budget: int = 400):
+    """
+    Choose the catalog rows relevant to this turn, most important first, until token_budget is spent:
+    items named in the utterance (exact, alias or fuzzy), items in the cart, recently ordered items,
+    whole categories the user asked about ("what fruits do you have"), then alternatives from the
+    categories already in play. Returns {category: {name: price}}.
+    """
+    picked = {}
+    used = 0
+
+    def add(name, price=None, category=None):
+        nonlocal used
+        if not name or name in picked:
+            return True
+        if price is None:
+            price, category = index.get(name)
+            if price is None:
+                return True
+        cost = estimate_tokens(f"{name} {price}, ")
+        if used + cost > token_budget:
+            return False
+        picked[name] = (price, category)
+        used += cost
+        return True
+
+    words = normalize_name(utterance).split()
+    mentioned = index.search(utterance, limit=10)
+    # misheard words that matched nothing exactly ("brocoli")
+    misheard = [(index.spot(w)[0],) for w in words
+                if len(w) >= 4 and w not in STOPWORDS and index.resolve(w, fuzzy=False) is None]
+
+    groups = [
+        mentioned,
+        misheard,
+        [(index.resolve(it.get("item", ""), fuzzy=False),) for it in cart_items],
+        [(index.resolve(it.get("item", ""), fuzzy=False),) for it in reversed(list(recent_items))],
+    ]
+    for group in groups:
+        for row in group:
+            if not add(*row):
+                return _group(picked)
+
+    for category in mentioned_categories(index, set(words)):
+        for row in index.category_items(category, limit=50):
+            if not add(*row):
+                return _group(picked)
+
+    for category in list(dict.fromkeys(cat for _, cat in picked.values())):
+        for row in index.category_items(category, limit=5):
+            if not add(*row):
+                return _group(picked)
+    return _group(picked)
+
+
+def _group(picked):
+    grouped = {}
+    for name, (price, category) in picked.items():
+        grouped.setdefault(category, {})[name] = price
+    return grouped
+
+
+def _unit_suffix(name: str) -> str:
+    unit = pricing_unit(name)
+    return "" if unit == "kg" else f"/{unit}"
+
+
+def render_catalog(selected: dict, categories) -> str:
+    """Compact one-line-per-category price list, plus the category names so the model knows what else exists"""
+    lines = [f"{category}: " + ", ".join(f"{name} {price}{_unit_suffix(name)}" for name, price in items.items())
+             for category, items in selected.items()]
+    if not lines:
+        lines.append("(no specific items matched)")
+    lines.append("Categories available: " + ", ".join(categories))
+    return "Prices in Rs/kg unless marked\n" + "\n".join(lines)
+
+
+_CART_CACHE_SIZE = 2048
+_cart_cache = OrderedDict()
+_cart_cache_lock = threading.Lock()
+
+
+def render_cart(session_id: str, cart: dict) -> str:
+    """Cart block for the prompt; cached per (session, cart version) so an unchanged cart is rendered once"""
+    key = (session_id, cart.get("version", 0))
+    with _cart_cache_lock:
+        text = _cart_cache.get(key)
+        if text is not None:
+            _cart_cache.move_to_end(key)
+            metrics.incr("cart_render_cache_hits")
+            return text
+    metrics.incr("cart_render_cache_misses")
+    if cart.get("items"):
+        # use ASCII 'Rs' to avoid rupee symbol
+        lines = [f"- {format_quantity(it['quantity'], it.get('unit', 'kg'))} {it['item']} "
+                 f"@ Rs{it['price']}/{it.get('unit', 'kg')} = Rs{it['total']}" for it in cart["items"]]
+    else:
+        lines = ["Cart is empty"]
+    lines.append(f"Total Items: {cart.get('total_items', 0)}, Subtotal: Rs{cart.get('subtotal', 0)}")
+    text = "\n".join(lines)
+    with _cart_cache_lock:
+        _cart_cache[key] = text
+        if len(_cart_cache) > _CART_CACHE_SIZE:
+            _cart_cache.popitem(last=False)
+    return text
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens * 4 - 3)].rstrip() + "..."
+
+
+def build_context(session_id: str, cart: dict, history, last_orders, token_budget: int = 600,
+                  max_message_tokens: int = 80) -> str:
+    """
+    Conversation context filled by priority within token_budget: the cart block always goes in,
+    then the last ordered items, then chat history from newest to oldest until the budget runs out.
+    """
+    sections = ["=== CURRENT SHOPPING CART ===", render_cart(session_id, cart)]
+    used = estimate_tokens("\n".join(sections))
+
+    recent = [x.get("item", "") for x in last_orders[-3:]]
+    if recent:
+        line = f"=== LAST ORDERED ===\n{', '.join(recent)}"
+        if used + estimate_tokens(line) <= token_budget:
+            sections.append(line)
+            used += estimate_tokens(line)
+
+    header = "=== CONVERSATION (oldest first) ==="
+    used += estimate_tokens(header)
+    picked = []
+    for msg in reversed(history):
+        remaining = token_budget - used
+        if remaining <= 8:
+            break
+        role = "User" if msg.get("role") == "user" else "Assistant"
+        line = _clip(f"{role}: {msg.get('message', '')}", min(max_message_tokens, remaining))
+        picked.append(line)
+        used += estimate_tokens(line) + 1
+    if picked:
+        sections.append(header)
+        sections.extend(reversed(picked))
+    metrics.incr("context_turns")
+    metrics.incr("context_tokens", used)
+    return "\n".join(sections)
@@ -0,0 +1,220 @@
+"""
+Table-driven quantity parsing and unit normalization.
+
+Spoken amounts ("500 g", "half a kilo", "two and a half kilos", "a dozen eggs", "1 1/2 kg")
+are read from the token stream produced by nlu and converted to the unit each item is priced
+in. Everything is dict lookups over a few tokens, so it costs microseconds.
+"""
+from typing import NamedTuple
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+    "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20,
+    "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+SCALE_WORDS = {"hundred": 100, "thousand": 1000}
+FRACTION_WORDS = {"half": 0.5, "quarter": 0.25}
+# words that stand for a number on their own ("a couple of", "a dozen")
+COUNT_WORDS = {"couple": 2, "pair": 2, "dozen": 12}
+ARTICLES = {"a", "an"}
+
+# spoken unit -> (canonical unit, dimension, size in the dimension's base unit)
+UNITS = {
+    "kg": ("kg", "mass", 1.0), "kgs": ("kg", "mass", 1.0), "kilo": ("kg", "mass", 1.0),
+    "kilos": ("kg", "mass", 1.0), "kilogram": ("kg", "mass", 1.0), "kilograms": ("kg", "mass", 1.0),
+    "g": ("g", "mass", 0.001), "gm": ("g", "mass", 0.001), "gms": ("g", "mass", 0.001),
+    "gram": ("g", "mass", 0.001), "grams": ("g", "mass", 0.001),
+    "lb": ("lb", "mass", 0.4536), "lbs": ("lb", "mass", 0.4536), "pound": ("lb", "mass", 0.4536),
+    "pounds": ("lb", "mass", 0.4536),
+    "l": ("l", "volume", 1.0), "litre": ("l", "volume", 1.0), "litres": ("l", "volume", 1.0),
+    "liter": ("l", "volume", 1.0), "liters": ("l", "volume", 1.0),
+    "ml": ("ml", "volume", 0.001), "millilitre": ("ml", "volume", 0.001), "milliliter": ("ml", "volume", 0.001),
+    "dozen": ("dozen", "count", 12.0), "dozens": ("dozen", "count", 12.0),
+    "piece": ("piece", "count", 1.0), "pieces": ("piece", "count", 1.0), "pcs": ("piece", "count", 1.0),
+    "packet": ("packet", "count", 1.0), "packets": ("packet", "count", 1.0),
+}
+# units prices can be quoted in -> (dimension, size in base unit)
+PRICING_UNITS = {"kg": ("mass", 1.0), "l": ("volume", 1.0), "dozen": ("count", 12.0), "piece": ("count", 1.0)}
+# pricing unit per catalog item; everything not listed is priced per kg
+ITEM_PRICING_UNITS = {"eggs": "dozen", "milk": "l", "oil": "l"}
+# typical weight of one piece, so "a dozen bananas" can be sold by the kg
+PIECE_WEIGHT_KG = {
+    "apple": 0.2, "banana": 0.12, "orange": 0.15, "mango": 0.3, "kiwi": 0.08, "pomegranate": 0.25,
+    "pineapple": 1.5, "watermelon": 4.0, "potato": 0.2, "tomato": 0.1, "onion": 0.15, "carrot": 0.1,
+    "cabbage": 1.0, "cauliflower": 0.8, "broccoli": 0.4, "capsicum": 0.15, "cucumber": 0.3, "eggs": 0.05,
+    "bread": 0.4,
+}
+# milk/oil sold by volume can be asked for by weight and vice versa (close enough for groceries)
+VOLUME_KG_PER_L = 1.0
+
+UNIT_LABELS = {"kg": "kg", "l": "L", "dozen": " dozen", "piece": " pc"}
+
+
+class Quantity(NamedTuple):
+    value: float
+    unit: str      # canonical spoken unit ("kg", "g", "dozen", ...) or "" for a bare number
+    consumed: int  # tokens used
+
+
+def _clean(value):
+    value = round(value, 3)
+    return int(value) if float(value).is_integer() else value
+
+
+def _number_token(tok: str):
+    """Numeric value of a digit/decimal/fraction token, or None"""
+    if not tok or not (tok[0].isdigit() or tok[0] == "."):
+        return None
+    try:
+        if "/" in tok:
+            num, den = tok.split("/", 1)
+            return float(num) / float(den) if float(den) else None
+        return float(tok)
+    except ValueError:
+        return None
+
+
+def starts_quantity(tokens, i) -> bool:
+    tok = tokens[i]
+    if _number_token(tok) is not None or tok in NUMBER_WORDS or tok in FRACTION_WORDS or tok in COUNT_WORDS:
+        return True
+    # "a kilo", "a dozen", "half a kilo", "a couple of" — a lone "a" is not a quantity
+    if tok in ARTICLES and i + 1 < len(tokens):
+        nxt = tokens[i + 1]
+        return nxt in UNITS or nxt in FRACTION_WORDS or nxt in COUNT_WORDS
+    return False
+
+
+def _fraction_tail(tokens, j):
+    """Value and length of a trailing "and a half" / "and a quarter", else (0, 0)"""
+    if j + 2 < len(tokens) and tokens[j] == "and" and tokens[j + 1] in ARTICLES and tokens[j + 2] in FRACTION_WORDS:
+        return FRACTION_WORDS[tokens[j + 2]], 3
+    return 0, 0
+
+
+def _read_number(tokens, i):
+    """(value, consumed) for a number starting at i: digits, fractions, number words, articles"""
+    n = len(tokens)
+    tok = tokens[i]
+    value = _number_token(tok)
+    if value is not None:
+        # mixed number: "1 1/2"
+        if i + 1 < n and "/" in tokens[i + 1] and _number_token(tokens[i + 1]) is not None:
+            return value + _number_token(tokens[i + 1]), 2
+        return value, 1
+    if tok in NUMBER_WORDS:
+        # "two thousand five hundred": hundred scales the group being read, thousand closes it
+        total, group, used = 0, 0, 0
+        while i + used < n:
+            word = tokens[i + used]
+            if word in NUMBER_WORDS:
+                group += NUMBER_WORDS[word]
+            elif word == "hundred" and group:
+                group *= 100
+            elif word in SCALE_WORDS and group:
+                total += group * SCALE_WORDS[word]
+                group = 0
+            elif (word == "and" and used and tokens[i + used - 1] in SCALE_WORDS and i + used + 1 < n
+                  and tokens[i + used + 1] in NUMBER_WORDS):
+                pass   # "two hundred and fifty": part of the number, not a list separator
+            else:
+                break
+            used += 1
+        return total + group, used
+    if tok in FRACTION_WORDS:
+        return FRACTION_WORDS[tok], 1
+    if tok in ARTICLES:
+        # "a half kilo" is a half, "a kilo" / "a dozen" is one
+        if i + 1 < n and tokens[i + 1] in FRACTION_WORDS:
+            return FRACTION_WORDS[tokens[i + 1]], 2
+        return 1, 1
+    return None, 0
+
+
+def parse_quantity(tokens, i):
+    """
+    Read a quantity starting at tokens[i]; returns a Quantity or None.
+    Handles "500 g", "2.5 kg", "1/2 kg", "1 1/2 kg", "two kilos", "half a kilo", "a dozen",
+    "two dozen", "one and a half kg", "a kilo and a half", "a couple of".
+    """
+    if not starts_quantity(tokens, i):
+        return None
+    n = len(tokens)
+    if tokens[i] in COUNT_WORDS:
+        # "dozen eggs", "couple of apples"
+        value, unit, j = (1, "dozen", i + 1) if tokens[i] == "dozen" else (COUNT_WORDS[tokens[i]], "piece", i + 1)
+    else:
+        value, used = _read_number(tokens, i)
+        if value is None:
+            return None
+        unit, j = "", i + used
+        extra, used = _fraction_tail(tokens, j)
+        value, j = value + extra, j + used
+        # "a dozen", "two dozen", "a couple of"
+        if j < n and tokens[j] in COUNT_WORDS:
+            if tokens[j] == "dozen":
+                unit = "dozen"
+            else:
+                value, unit = value * COUNT_WORDS[tokens[j]], "piece"
+            j += 1
+    # "half a kilo"
+    if j + 1 < n and tokens[j] in ARTICLES and tokens[j + 1] in UNITS:
+        j += 1
+    if not unit and j < n and tokens[j] in UNITS:
+        unit = UNITS[tokens[j]][0]
+        j += 1
+        # "a kilo and a half"
+        extra, used = _fraction_tail(tokens, j)
+        value, j = value + extra, j + used
+    # "2 kg of rice", "a couple of apples"
+    if j < n and tokens[j] == "of":
+        j += 1
+    return Quantity(_clean(value), unit, j - i)
+
+
+def pricing_unit(item: str) -> str:
+    return ITEM_PRICING_UNITS.get(item, "kg")
+
+
+def to_pricing_unit(value, unit: str, item: str):
+    """
+    Convert a spoken amount to the item's pricing unit. A bare number means the pricing unit, as
+    before ("2 apples" = 2 kg), except for items sold by count where it means pieces ("6 eggs" =
+    half a dozen). Returns the converted amount, or None when the units can't be related
+    (e.g. pieces of an item with no known piece weight).
+    """
+    target = pricing_unit(item)
+    if not unit:
+        if PRICING_UNITS[target][0] != "count":
+            return _clean(value)
+        unit = "piece"
+    spoken = UNITS.get(unit)
+    if spoken is None:
+        return None
+    _, dim, size = spoken
+    base = value * size
+    t_dim, t_size = PRICING_UNITS[target]
+    if dim == t_dim:
+        return _clean(base / t_size)
+    if dim == "volume" and t_dim == "mass":
+        return _clean(base * VOLUME_KG_PER_L / t_size)
+    if dim == "mass" and t_dim == "volume":
+        return _clean(base / VOLUME_KG_PER_L / t_size)
+    piece_kg = PIECE_WEIGHT_KG.get(item)
+    if piece_kg:
+        if dim == "count" and t_dim == "mass":
+            return _clean(base * piece_kg / t_size)
+        if dim == "mass" and t_dim == "count":
+            return _clean(base / piece_kg / t_size)
+    return None
+
+
+def format_quantity(value, unit: str = "kg") -> str:
+    """2 kg -> "2kg", 0.5 l -> "0.5L", 1 dozen -> "1 dozen\""""
+    return f"{_clean(value)}{UNIT_LABELS.get(unit, ' ' + unit)}"
+
+
+def per_unit(unit: str = "kg") -> str:
+    """Label used after a price: "Rs80 per kg", "Rs80 per dozen\""""
+    return {"l": "litre"}.get(unit, unit)
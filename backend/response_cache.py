@@ -0,0 +1,136 @@
+"""
+Bounded LRU + TTL cache of model replies.
+
+Key: (normalized utterance, catalog version, cart fingerprint). The cart part is only filled in
+when the utterance refers to the cart ("what's my total", "anything missing from my basket"),
+so "how much are apples" is shared by every session. Only utterances that name an item or a
+category are cached: "yes", "how much is it" or "that one" answer whatever the conversation was
+about, so their replies belong to one session. A catalog reload changes the version in every
+new key; the first lookup under a new version drops the old entries.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from fuzzy import is_common_word
+
+# words that make a reply depend on what is in the cart
+CART_REFERENCES = {"cart", "basket", "my", "mine", "bought", "ordered", "added", "total", "bill",
+                   "subtotal", "checkout"}
+# words that don't change the question
+IGNORED_WORDS = {"please", "pls", "hey", "hi", "hello", "ok", "okay", "so", "um", "uh", "bot", "grocerybot"}
+
+
+def normalize_utterance(words) -> str:
+    """Analysis words -> cache text: "Hey, how much are Apples please?" -> "how much are apples\""""
+    return " ".join(w for w in words if w not in IGNORED_WORDS)
+
+
+def cart_fingerprint(cart: dict) -> str:
+    lines = sorted((it.get("item", ""), it.get("quantity", 0)) for it in (cart or {}).get("items", []))
+    return hashlib.sha1(repr(lines).encode()).hexdigest()[:12]
+
+
+def names_subject(analysis, categories=()) -> bool:
+    """True when the utterance names a catalog item or category ("fruits", "any dairy?")"""
+    if any(segment.items for segment in analysis.segments):
+        return True
+    # "other" is a category too, but "the other one" is not about it
+    named = {c.lower() for c in categories if not is_common_word(c.lower())}
+    return any(w in named or w + "s" in named for w in analysis.words)
+
+
+def cache_key(analysis, catalog_version: str, cart: dict, categories=()):
+    """None when the utterance normalizes to nothing worth caching or depends on earlier turns"""
+    text = normalize_utterance(analysis.words)
+    if not text or analysis.truncated or not names_subject(analysis, categories):
+        return None
+    cart_part = cart_fingerprint(cart) if CART_REFERENCES.intersection(analysis.words) else ""
+    return text, catalog_version, cart_part
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (stored_at, text)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def _check_version(self, version: str):
+        # caller holds the lock
+        if version != self._version:
+            if self._entries:
+                metrics.incr("response_cache_invalidations")
+                self._entries.clear()
+            self._version = version
+
+    def get(self, key):
+        if key is None or not self.enabled:
+            return None
+        with self._lock:
+            self._check_version(key[1])
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                metrics.incr("response_cache_expired")
+                entry = None
+            if entry is None:
+                metrics.incr("response_cache_misses")
+                return None
+            self._entries.move_to_end(key)
+        metrics.incr("response_cache_hits")
+        return entry[1]
+
+    def put(self, key, text: str, stored_at: float = None):
+        if key is None or not text or not self.enabled:
+            return
+        with self._lock:
+            self._check_version(key[1])
+            self._entries[key] = (stored_at or time.time(), text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("response_cache_evictions")
+            metrics.set_gauge("response_cache_size", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            metrics.set_gauge("response_cache_size", 0)
+
+    def warm_from_sessions(self, saved, analyze, catalog_version: str, categories=()) -> int:
+        """
+        Seed the cache from saved chat logs (session dicts, see session_log): each model reply
+        given under the current catalog version, keyed on the user message before it. Only
+        cart-independent questions are used, since the cart they were asked against is not
+        recorded. Returns entries added.
+        """
+        if not self.enabled:
+            return 0
+        now = time.time()
+        added = 0
+        for state in saved:
+            history = state.get("chat_history", []) if isinstance(state, dict) else []
+            for asked, answered in zip(history, history[1:]):
+                if asked.get("role") != "user" or answered.get("role") != "assistant":
+                    continue
+                if answered.get("source") != "model" or answered.get("catalog_version") != catalog_version:
+                    continue
+                analysis = analyze(asked.get("message", ""))
+                key = cache_key(analysis, catalog_version, None, categories)
+                if key is None or key[2]:
+                    continue
+                # the stored message may start with the cart update; the model's reply is the last part
+                self.put(key, answered.get("message", "").split("\n\n")[-1], stored_at=now)
+                added += 1
+        return added
@@ -0,0 +1,293 @@
+"""
+Saved sessions as append-only event logs.
+
+Each session has up to three files in the saved_sessions directory:
+    {sid}.json              snapshot (the same shape the full per-request dumps used to have)
+    {sid}.jsonl             events appended since the snapshot, one JSON object per line
+    {sid}.jsonl.compacting  a log being folded into the snapshot right now
+
+Events:
+    {"type": "message", "n": 4, "at": ..., "message": {...}}   chat entry number n
+    {"type": "cart", "at": ..., "cart": {...}}                 the cart after a change
+    {"type": "context", "at": ..., "context": {...}}           user_context after a change
+    {"type": "file", "at": ..., "file": {...}}                 a generated PDF
+
+record() appends only what changed since the session's last save, so a request costs the same
+however long the chat history is. With a writer attached (write_behind.py) the append itself
+happens on a background thread. Logs that grow past compact_bytes are folded into their
+snapshot by a background thread: the log is renamed aside (new events start a fresh log), merged
+and the snapshot is replaced atomically. load() rebuilds a session from snapshot plus logs;
+message events carry their position, so a log that was folded but not yet deleted is harmless.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:   # no fcntl on Windows: appends and compaction are not guarded across processes
+    fcntl = None
+
+# session key holding what record() has already written
+CURSOR_KEY = "_log_cursor"
+# session key: position in the whole conversation of session["chat_history"][0]
+OFFSET_KEY = "chat_offset"
+
+
+def _fingerprint(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def _apply(state: dict, event: dict):
+    kind = event.get("type")
+    if kind == "message":
+        history = state.setdefault("chat_history", [])
+        # already in the snapshot (or an earlier log) when its position is taken
+        if event.get("n", len(history)) >= len(history):
+            history.append(event["message"])
+    elif kind == "cart":
+        state["shopping_cart"] = event["cart"]
+    elif kind == "context":
+        state["user_context"] = event["context"]
+    elif kind == "file":
+        files = state.setdefault("generated_files", [])
+        if event["file"] not in files:
+            files.append(event["file"])
+    state["saved_at"] = event.get("at", state.get("saved_at"))
+
+
+def _read_events(path: str):
+    try:
+        with open(path) as fh:
+            lines = fh.readlines()
+    except OSError:
+        return []
+    events = []
+    for line in lines:
+        try:
+            events.append(json.loads(line))
+        except ValueError:   # a line cut short by a crash mid-append
+            continue
+    return events
+
+
+class SessionLog:
+    def __init__(self, directory: str = "saved_sessions", compact_bytes: int = 65536, fsync: bool = True):
+        # compact_bytes: log size that queues a session for compaction (0 = compact only when asked)
+        # fsync: batches from the write-behind queue are fsynced before they count as written
+        self.directory = directory
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self.writer = None   # a write_behind.WriteBehind(self.write_batch, ...) to take appends off the request thread
+        self._due = set()
+        self._due_lock = threading.Lock()
+        self._compactor = None
+        self._lock_fd = None
+        os.makedirs(directory, exist_ok=True)
+        if fcntl is not None:
+            # one fd for the life of the process, as in singleflight: compactions lock one byte per session
+            self._lock_fd = os.open(os.path.join(directory, "compact.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _path(self, sid: str, suffix: str) -> str:
+        return os.path.join(self.directory, sid + suffix)
+
+    # ----------------- writing -----------------
+    def append(self, sid: str, events):
+        """Append events to the session's log, through the write-behind queue when there is one"""
+        if not events:
+            return
+        if self.writer is None:
+            self.write(sid, events)
+            return
+        # the events point into the live session, which may change again before the writer runs
+        events = json.loads(json.dumps(events, default=str))
+        if not self.writer.submit(sid, events):
+            self.writer.write_now(sid, events)
+
+    def write(self, sid: str, events, fsync: bool = False):
+        """Append events to the session's log now, in one write"""
+        data = "".join(json.dumps(e, default=str) + "\n" for e in events).encode()
+        path = self._path(sid, ".jsonl")
+        while True:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    # renamed aside for compaction after we opened it: write to the new log instead
+                    try:
+                        if os.stat(path).st_ino != os.fstat(fd).st_ino:
+                            continue
+                    except FileNotFoundError:
+                        continue
+                os.write(fd, data)
+                if fsync:
+                    os.fsync(fd)
+                size = os.fstat(fd).st_size
+                break
+            finally:
+                os.close(fd)
+        metrics.incr("session_log_appends")
+        if self.compact_bytes and size > self.compact_bytes:
+            with self._due_lock:
+                self._due.add(sid)
+
+    def write_batch(self, batch: dict):
+        """{sid: events} from the write-behind queue: one write and one fsync per session"""
+        for sid, events in batch.items():
+            if events:
+                self.write(sid, events, fsync=self.fsync)
+
+    def record(self, session, keep: int = 0) -> str:
+        """
+        Append whatever changed in this session (new chat messages, cart, user context) since the
+        last record(), and remember how far it got in the session itself. With keep > 0, chat
+        messages beyond the last `keep` are then dropped from the session: they are in the log,
+        and messages() pages them back in. Returns the log path.
+        """
+        sid = session["session_id"]
+        cursor = dict(session.get(CURSOR_KEY) or {"messages": 0, "cart": None, "context": None})
+        now = datetime.now().isoformat()
+        events = []
+        history = session.get("chat_history", [])
+        # positions count from the start of the conversation, not of what the session still holds
+        offset = session.get(OFFSET_KEY, 0)
+        for n in range(max(cursor["messages"], offset), offset + len(history)):
+            events.append({"type": "message", "n": n, "at": now, "message": history[n - offset]})
+        cart, context = session.get("shopping_cart", {}), session.get("user_context", {})
+        cart_print, context_print = _fingerprint(cart), _fingerprint(context)
+        if cart_print != cursor["cart"]:
+            events.append({"type": "cart", "at": now, "cart": cart})
+        if context_print != cursor["context"]:
+            events.append({"type": "context", "at": now, "context": context})
+        if events:
+            self.append(sid, events)
+            session[CURSOR_KEY] = {"messages": offset + len(history), "cart": cart_print, "context": context_print}
+        if keep > 0 and len(history) > keep:
+            dropped = len(history) - keep
+            session["chat_history"] = history[dropped:]
+            session[OFFSET_KEY] = offset + dropped
+            metrics.incr("chat_messages_archived", dropped)
+        return self._path(sid, ".jsonl")
+
+    def add_file(self, sid: str, meta: dict):
+        self.append(sid, [{"type": "file", "at": datetime.now().isoformat(), "file": meta}])
+
+    # ----------------- reading -----------------
+    def load(self, sid: str):
+        """The saved session (snapshot + logs) as one dict, or None if nothing was saved"""
+        return self._fold(sid, (".jsonl.compacting", ".jsonl"))
+
+    def _fold(self, sid: str, logs):
+        state = None
+        try:
+            with open(self._path(sid, ".json")) as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            pass
+        events = [event for suffix in logs for event in _read_events(self._path(sid, suffix))]
+        if state is None and not events:
+            return None
+        state = state or {"session_id": sid, "shopping_cart": {}, "chat_history": [], "user_context": {}}
+        for event in events:
+            _apply(state, event)
+        return state
+
+    def messages(self, sid: str, start: int, end: int):
+        """Chat messages start..end-1 (positions in the whole conversation) from the saved session"""
+        if self.writer is not None:
+            self.writer.flush()   # the newest archived messages may still be queued
+        state = self.load(sid) or {}
+        return state.get("chat_history", [])[start:end]
+
+    def recent(self, max_sessions: int = 500):
+        """(sid, state) for the most recently saved sessions, oldest first"""
+        latest = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json*")):
+            sid = os.path.basename(path).split(".", 1)[0]
+            try:
+                latest[sid] = max(latest.get(sid, 0), os.path.getmtime(path))
+            except OSError:
+                continue
+        for sid in sorted(latest, key=latest.get)[-max_sessions:]:
+            try:
+                state = self.load(sid)
+            except (OSError, ValueError):
+                continue
+            if state is not None:
+                yield sid, state
+
+    # ----------------- compaction -----------------
+    def _offset(self, sid: str) -> int:
+        return int(hashlib.sha1(sid.encode()).hexdigest()[:8], 16) & 0x7FFFFFFF
+
+    def compact(self, sid: str) -> bool:
+        """Fold the session's log into its snapshot; False if another worker is already on it"""
+        if self._lock_fd is not None:
+            try:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, self._offset(sid))
+            except OSError:
+                return False
+        try:
+            log, aside = self._path(sid, ".jsonl"), self._path(sid, ".jsonl.compacting")
+            # a log left aside by a compaction that died is folded first; the current log waits its turn
+            if not os.path.exists(aside):
+                try:
+                    os.rename(log, aside)
+                except FileNotFoundError:
+                    return True
+            if fcntl is not None:
+                # wait out appends that opened the log before the rename
+                fd = os.open(aside, os.O_RDONLY)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                finally:
+                    os.close(fd)
+            # the live log stays out: its events belong to the next compaction
+            state = self._fold(sid, (".jsonl.compacting",))
+            if state is None:
+                os.remove(aside)
+                return True
+            snapshot = self._path(sid, ".json")
+            with open(snapshot + ".tmp", "w") as fh:
+                json.dump(state, fh, indent=2, default=str)
+            os.replace(snapshot + ".tmp", snapshot)
+            os.remove(aside)
+            metrics.incr("session_log_compactions")
+            return True
+        finally:
+            if self._lock_fd is not None:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, self._offset(sid))
+
+    def compact_due(self) -> int:
+        """Compact every session whose log passed compact_bytes; returns how many were done"""
+        with self._due_lock:
+            due, self._due = self._due, set()
+        done = 0
+        for sid in due:
+            try:
+                done += self.compact(sid)
+            except (OSError, ValueError) as e:
+                print(f"Session log compaction failed for {sid}: {e}")
+        return done
+
+    def start_compacting(self, interval: float = 30.0):
+        """Run compact_due() every interval seconds in a daemon thread"""
+        if self._compactor is not None or interval <= 0:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact_due()
+                except Exception as e:
+                    print(f"Session log compactor error: {e}")
+
+        self._compactor = threading.Thread(target=_loop, name="session-log-compactor", daemon=True)
+        self._compactor.start()
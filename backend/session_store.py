@@ -0,0 +1,223 @@
+"""
+Server-side sessions in SQLite, for SESSION_BACKEND=sqlite.
+
+Flask-Session's filesystem store keeps one pickle file per session, rewrites it on every request
+and finds expired files only by scanning the directory. Here each session is one row (sid, JSON
+data, expiry) of a WAL-mode database: readers don't block the writer, all workers on the host
+share the file, and expiry is an indexed column, so stale sessions go with one range delete.
+
+Each worker also keeps recently used sessions in an LRU front cache. Every write stamps the row
+with a new random revision; a cached copy is used while its revision still matches the row's,
+which is a primary-key lookup that doesn't read or parse the session data.
+
+Both interfaces write a session only when its content changed since it was opened (nested
+edits like session["shopping_cart"]["items"].append(...) included), or when the last write is
+older than refresh_seconds, which keeps a permanent session and its cookie from expiring while
+the user is only reading. Everything else counts as session_writes_skipped.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask_session.sessions import FileSystemSessionInterface, ServerSideSession, SessionInterface
+from itsdangerous import BadSignature, want_bytes
+
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL,
+                                     rev INTEGER NOT NULL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+"""
+
+
+class SqliteSessionStore:
+    def __init__(self, path: str, cache_size: int = 1024, purge_interval: float = 60):
+        # cache_size 0 disables the front cache; purge_interval: seconds between expiry sweeps
+        self.path = path
+        self.cache_size = cache_size
+        self.purge_interval = purge_interval
+        self._cache = OrderedDict()   # sid -> (rev, JSON text)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # one autocommit connection per thread; WAL lets the other workers read while one writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions WHERE expires > ?", (time.time(),)).fetchone()[0]
+
+    # ----------------- front cache -----------------
+    def _cached(self, sid: str):
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                self._cache.move_to_end(sid)
+            return entry
+
+    def _remember(self, sid: str, rev: int, text: str):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[sid] = (rev, text)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid: str):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    # ----------------- rows -----------------
+    def load(self, sid: str):
+        """The session's data, or None if there is no such session or it has expired"""
+        conn, now = self._conn(), time.time()
+        cached = self._cached(sid)
+        if cached is not None:
+            row = conn.execute("SELECT rev FROM sessions WHERE sid = ? AND expires > ?", (sid, now)).fetchone()
+            if row is not None and row[0] == cached[0]:
+                metrics.incr("session_cache_hits")
+                return json.loads(cached[1])
+        metrics.incr("session_cache_misses")
+        row = conn.execute("SELECT rev, data FROM sessions WHERE sid = ? AND expires > ?", (sid, now)).fetchone()
+        if row is None:
+            self._forget(sid)
+            return None
+        self._remember(sid, row[0], row[1])
+        return json.loads(row[1])
+
+    def save(self, sid: str, data: dict, lifetime: float):
+        text = json.dumps(data, separators=(",", ":"))
+        rev = random.getrandbits(62)
+        self._conn().execute("INSERT OR REPLACE INTO sessions (sid, data, expires, rev) VALUES (?, ?, ?, ?)",
+                             (sid, text, time.time() + lifetime, rev))
+        self._remember(sid, rev, text)
+        self._maybe_purge()
+
+    def delete(self, sid: str):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        self._forget(sid)
+
+    def purge_expired(self) -> int:
+        """Delete expired sessions (a range scan of the expiry index); returns how many went"""
+        removed = self._conn().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),)).rowcount
+        if removed:
+            metrics.incr("sessions_purged", removed)
+        return removed
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        try:
+            self.purge_expired()
+        except sqlite3.OperationalError as e:   # busy: another worker is sweeping, try next time
+            print("Session purge skipped:", e)
+
+
+class SqliteSession(ServerSideSession):
+    pass
+
+
+def _snapshot(session) -> str:
+    return json.dumps(dict(session), separators=(",", ":"), default=str)
+
+
+class ChangeTracking:
+    """Write-only-when-changed for a session interface (see the module docstring)"""
+    refresh_seconds = 300
+
+    def _opened(self, session):
+        if session is not None:
+            session.opened_as = _snapshot(session)
+        return session
+
+    def _needs_write(self, session) -> bool:
+        if _snapshot(session) != getattr(session, "opened_as", None):
+            metrics.incr("session_writes")
+        elif "_saved_at" in session and time.time() - session["_saved_at"] >= self.refresh_seconds:
+            metrics.incr("session_refreshes")
+        else:
+            # unchanged, or never stored and still empty
+            metrics.incr("session_writes_skipped")
+            return False
+        session["_saved_at"] = time.time()
+        # a second save in the same request (streamed replies) only writes if something changed again
+        session.opened_as = _snapshot(session)
+        return True
+
+
+class TrackedFileSystemSessionInterface(ChangeTracking, FileSystemSessionInterface):
+    """Flask-Session's filesystem interface, minus the rewrite on every request"""
+
+    def __init__(self, *args, refresh_seconds: float = 300, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.refresh_seconds = refresh_seconds
+
+    def open_session(self, app, request):
+        return self._opened(super().open_session(app, request))
+
+    def save_session(self, app, session, response):
+        if not session or self._needs_write(session):
+            super().save_session(app, session, response)
+
+
+class SqliteSessionInterface(ChangeTracking, SessionInterface):
+    """Drop-in for Flask-Session's filesystem interface: same cookie, same session object"""
+    session_class = SqliteSession
+
+    def __init__(self, store: SqliteSessionStore, use_signer: bool = False, permanent: bool = True,
+                 refresh_seconds: float = 300):
+        self.store = store
+        self.use_signer = use_signer
+        self.permanent = permanent
+        self.refresh_seconds = refresh_seconds
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.config["SESSION_COOKIE_NAME"])
+        if sid and self.use_signer:
+            signer = self._get_signer(app)
+            if signer is None:
+                return None
+            try:
+                sid = signer.unsign(sid).decode()
+            except BadSignature:
+                sid = None
+        data = self.store.load(sid) if sid else None
+        if data is not None:
+            return self._opened(self.session_class(data, sid=sid))
+        # unknown or expired sid: start over under a fresh one
+        return self._opened(self.session_class(sid=self._generate_sid(), permanent=self.permanent))
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(app.config["SESSION_COOKIE_NAME"], domain=domain, path=path)
+            return
+        if not self._needs_write(session):
+            return
+        self.store.save(session.sid, dict(session), app.permanent_session_lifetime.total_seconds())
+        session_id = self._get_signer(app).sign(want_bytes(session.sid)) if self.use_signer else session.sid
+        response.set_cookie(app.config["SESSION_COOKIE_NAME"], session_id,
+                            expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
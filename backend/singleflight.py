@@ -0,0 +1,263 @@
+"""
+Single-flight coalescing of identical model calls.
+
+When a promotion goes out, many people ask the same thing in the same second. Turns that would
+send the model the same prompt under the same catalog version (see prompt_key) share one model
+call: the first caller leads and makes the call, the others wait on its future for up to
+wait_timeout and get the same reply. Threads and asyncio tasks in one process join the same
+flights.
+
+With a lock directory, workers on the same host coalesce too: the leading worker holds a
+byte-range lock on a shared file while it calls the model and then writes the reply to a small
+result file, which the other workers poll for. Results must be JSON-serialisable for that.
+"""
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:   # no fcntl on Windows: coalescing stays within the process
+    fcntl = None
+
+# result files older than this are removed by the next leader
+_RESULT_MAX_AGE = 60
+_POLL_INTERVAL = 0.02
+
+
+def prompt_key(prompt: str, catalog_version: str) -> tuple:
+    """Flight key for a model call: the built prompt carries the conversation and cart context"""
+    return catalog_version, hashlib.sha1(prompt.encode()).hexdigest()
+
+
+class FlightAbandoned(Exception):
+    """The leading caller went away (cancelled) before its call finished"""
+
+
+class FlightGroup:
+    def __init__(self, wait_timeout: float = 3.0, lock_dir: str = None):
+        # wait_timeout: longest a follower waits for the leader before calling the model itself; 0 disables
+        self.wait_timeout = wait_timeout
+        self.lock_dir = lock_dir if lock_dir and fcntl is not None else None
+        self._flights = {}   # key -> Future of the leading call
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        self._last_sweep = 0.0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            # one fd for the life of the process: closing any fd of the file would drop all our locks on it
+            self._lock_fd = os.open(os.path.join(self.lock_dir, "flights.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+    @property
+    def enabled(self) -> bool:
+        return self.wait_timeout > 0
+
+    def __len__(self):
+        return len(self._flights)
+
+    # ----------------- in-process flights -----------------
+    def _join(self, key):
+        """(future, leading)"""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = self._flights[key] = Future()
+            metrics.set_gauge("coalesce_inflight", len(self._flights))
+        metrics.incr("coalesce_leaders")
+        return future, True
+
+    def _land(self, key, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            self._flights.pop(key, None)
+            metrics.set_gauge("coalesce_inflight", len(self._flights))
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _wait_budget(self, timeout):
+        return self.wait_timeout if timeout is None else max(0.0, min(self.wait_timeout, timeout))
+
+    def do(self, key, fn, timeout: float = None):
+        """
+        fn() once among concurrent callers with the same key; returns its result (or raises its
+        error). timeout further caps a follower's wait, e.g. the turn's remaining deadline; a
+        follower that times out, or whose leader was cancelled, calls fn() itself.
+        """
+        if key is None or not self.enabled:
+            return fn()
+        future, leading = self._join(key)
+        if leading:
+            try:
+                result = self._call_shared(key, fn, timeout)
+            except BaseException as e:
+                self._land(key, future, error=e)
+                raise
+            self._land(key, future, result)
+            return result
+        try:
+            result = future.result(timeout=self._wait_budget(timeout))
+        except FutureTimeout:
+            if not future.done():
+                metrics.incr("coalesce_wait_timeouts")
+                return fn()
+            # the leader's own TimeoutError (DeadlineExceeded, QueueTimeout), not this wait's
+            if self._leader_abandoned(future):
+                return fn()
+            result = future.result()
+        except FlightAbandoned:
+            return fn()
+        metrics.incr("coalesced_requests")
+        return result
+
+    async def do_async(self, key, make_coro, timeout: float = None):
+        """do() for coroutines: make_coro() is awaited once among concurrent callers with the same key"""
+        if key is None or not self.enabled:
+            return await make_coro()
+        future, leading = self._join(key)
+        if leading:
+            try:
+                result = await self._call_shared_async(key, make_coro, timeout)
+            except asyncio.CancelledError:
+                self._land(key, future, error=FlightAbandoned())
+                raise
+            except BaseException as e:
+                self._land(key, future, error=e)
+                raise
+            self._land(key, future, result)
+            return result
+        try:
+            # shield: giving up on the wait must not cancel the leader's future
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self._wait_budget(timeout))
+        except asyncio.TimeoutError:
+            if not future.done():
+                metrics.incr("coalesce_wait_timeouts")
+                return await make_coro()
+            # the leader's own TimeoutError (DeadlineExceeded, QueueTimeout), not this wait's
+            if self._leader_abandoned(future):
+                return await make_coro()
+            result = future.result()
+        except FlightAbandoned:
+            return await make_coro()
+        metrics.incr("coalesced_requests")
+        return result
+
+    @staticmethod
+    def _leader_abandoned(future: Future) -> bool:
+        # a landed flight caught by a timeout handler: the leader may also have landed just as the
+        # wait gave up, in which case its result or error (re-raised by result()) is used as is
+        return isinstance(future.exception(), FlightAbandoned)
+
+    # ----------------- cross-worker flights -----------------
+    def _call_shared(self, key, fn, timeout):
+        if self.lock_dir is None:
+            return fn()
+        name = self._name(key)
+        if not self._try_lock(name):
+            # another worker is asking the same question: wait for its answer
+            since, give_up = time.time(), time.monotonic() + self._wait_budget(timeout)
+            while time.monotonic() < give_up and self._locked_elsewhere(name):
+                time.sleep(_POLL_INTERVAL)
+            found = self._read_result(name, since)
+            if found is not None:
+                return self._worker_hit(found)
+            metrics.incr("coalesce_wait_timeouts")
+            return fn()
+        try:
+            result = fn()
+            self._publish(name, result)
+            return result
+        finally:
+            self._unlock(name)
+
+    async def _call_shared_async(self, key, make_coro, timeout):
+        if self.lock_dir is None:
+            return await make_coro()
+        name = self._name(key)
+        if not self._try_lock(name):
+            since, give_up = time.time(), time.monotonic() + self._wait_budget(timeout)
+            while time.monotonic() < give_up and self._locked_elsewhere(name):
+                await asyncio.sleep(_POLL_INTERVAL)
+            found = self._read_result(name, since)
+            if found is not None:
+                return self._worker_hit(found)
+            metrics.incr("coalesce_wait_timeouts")
+            return await make_coro()
+        try:
+            result = await make_coro()
+            self._publish(name, result)
+            return result
+        finally:
+            self._unlock(name)
+
+    @staticmethod
+    def _name(key) -> str:
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+    @staticmethod
+    def _offset(name: str) -> int:
+        # each key locks one byte of the shared file; a collision only costs a duplicate call
+        return int(name[:8], 16) & 0x7FFFFFFF
+
+    def _try_lock(self, name: str) -> bool:
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, self._offset(name))
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self, name: str):
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, self._offset(name))
+
+    def _locked_elsewhere(self, name: str) -> bool:
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_SH | fcntl.LOCK_NB, 1, self._offset(name))
+        except OSError:
+            return True
+        self._unlock(name)
+        return False
+
+    def _worker_hit(self, result):
+        metrics.incr("coalesced_requests")
+        metrics.incr("coalesce_cross_worker")
+        return result
+
+    def _publish(self, name: str, result):
+        path = os.path.join(self.lock_dir, name + ".json")
+        try:
+            with open(path + ".tmp", "w") as fh:
+                json.dump({"at": time.time(), "result": result}, fh)
+            os.replace(path + ".tmp", path)
+        except (OSError, TypeError, ValueError) as e:
+            print("Couldn't share model reply with other workers:", e)
+        self._sweep()
+
+    def _read_result(self, name: str, since: float):
+        """The other worker's result, if it was written after we started waiting"""
+        try:
+            with open(os.path.join(self.lock_dir, name + ".json")) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        # a second of slack covers a reply written just before its lock was released
+        return data.get("result") if data.get("at", 0) >= since - 1.0 else None
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < _RESULT_MAX_AGE:
+            return
+        self._last_sweep = now
+        for path in glob.glob(os.path.join(self.lock_dir, "*.json")):
+            try:
+                if now - os.path.getmtime(path) > _RESULT_MAX_AGE:
+                    os.remove(path)
+            except OSError:
+                pass
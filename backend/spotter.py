@@ -0,0 +1,103 @@
+"""
+Word-level Aho-Corasick automaton for spotting catalog phrases in an utterance.
+
+Every alias ("apple", "apples", "aloo", "shimla mirch", ...) is a pattern; one left-to-right
+pass over the tokens reports every mention, however many patterns the catalog has. Words are
+interned to ids, transitions live in one {state << 32 | word_id: state} dict and the per-state
+links are flat arrays, so a 100k-item catalog stays affordable in memory.
+"""
+from array import array
+
+
+class PhraseSpotter:
+    def __init__(self, phrases: dict):
+        """phrases: space-separated phrase -> value (usually alias -> canonical name); kept, not copied"""
+        self.values = phrases
+        self.vocab = {}
+        self.goto = {}
+        self.length = bytearray(1)   # words in the phrase ending at a state, 0 if none does
+        for phrase in phrases:
+            self._insert(phrase)
+        self._link()
+
+    def __len__(self):
+        return len(self.values)
+
+    def _insert(self, phrase: str):
+        state = 0
+        words = phrase.split()
+        for word in words:
+            key = state << 32 | self.vocab.setdefault(word, len(self.vocab))
+            nxt = self.goto.get(key)
+            if nxt is None:
+                nxt = len(self.length)
+                self.goto[key] = nxt
+                self.length.append(0)
+            state = nxt
+        self.length[state] = min(len(words), 255)
+
+    def _link(self):
+        """Breadth-first failure links, plus output links to the nearest phrase end on the failure chain"""
+        size = len(self.length)
+        self.fail = array("i", bytes(4 * size))
+        self.out_link = array("i", bytes(4 * size))
+        children = {}
+        for key, nxt in self.goto.items():
+            children.setdefault(key >> 32, []).append((key & 0xFFFFFFFF, nxt))
+        queue = [0]
+        for state in queue:
+            for word, nxt in children.pop(state, ()):
+                if state:
+                    f = self.fail[state]
+                    while f and (f << 32 | word) not in self.goto:
+                        f = self.fail[f]
+                    f = self.goto.get(f << 32 | word, 0)
+                    self.fail[nxt] = f
+                    self.out_link[nxt] = f if self.length[f] else self.out_link[f]
+                queue.append(nxt)
+
+    def updated(self, phrases: dict):
+        """
+        Spotter for a new catalog version. When the phrase set is unchanged (price edits, the
+        common reload) the automaton is shared and only the value map is replaced; otherwise
+        it is rebuilt.
+        """
+        if phrases.keys() == self.values.keys():
+            clone = object.__new__(PhraseSpotter)
+            clone.__dict__.update(self.__dict__)
+            clone.values = phrases
+            return clone
+        return PhraseSpotter(phrases)
+
+    def longest_by_start(self, tokens) -> dict:
+        """{start index: (length in words, value)} for the longest phrase starting at each token"""
+        found = {}
+        goto, fail, out_link, length, vocab = self.goto, self.fail, self.out_link, self.length, self.vocab
+        state = 0
+        for end, word in enumerate(tokens, 1):
+            wid = vocab.get(word)
+            if wid is None:
+                # a word no phrase contains: nothing can continue through it
+                state = 0
+                continue
+            while state and (state << 32 | wid) not in goto:
+                state = fail[state]
+            state = goto.get(state << 32 | wid, 0)
+            hit = state if length[state] else out_link[state]
+            while hit:
+                start = end - length[hit]
+                if length[hit] > found.get(start, (0,))[0]:
+                    found[start] = (length[hit], None)
+                hit = out_link[hit]
+        for start, (size, _) in found.items():
+            found[start] = (size, self.values[" ".join(tokens[start:start + size])])
+        return found
+
+    def find(self, tokens):
+        """Non-overlapping leftmost-longest mentions as (start, length, value) tuples"""
+        spans, covered = [], 0
+        for start, (size, value) in sorted(self.longest_by_start(tokens).items()):
+            if start >= covered:
+                spans.append((start, size, value))
+                covered = start + size
+        return spans
@@ -0,0 +1,60 @@
+"""
+Sentence chunking and server-sent-event framing for streamed replies.
+
+Model output arrives in arbitrary pieces; SentenceChunker buffers them and hands back
+cleaned, sentence-sized chunks as soon as each sentence is complete, so speech synthesis
+can start on the first sentence while the rest is still being generated.
+"""
+import json
+import re
+
+# ., ! or ? followed by whitespace, or a blank line
+_BOUNDARY_RE = re.compile(r"[.!?]+[\"')\]]*\s+|\n{2,}")
+# words whose trailing "." doesn't end a sentence ("Rs. 80")
+_ABBREVIATIONS = {"rs", "mr", "mrs", "ms", "dr", "approx", "vs", "etc", "e.g", "i.e", "no"}
+
+
+class SentenceChunker:
+    def __init__(self, clean, min_chars: int = 24):
+        # clean: the text cleaner applied to every chunk (main.clean_text)
+        # min_chars: shorter sentences ("Sure.") are held and sent with the next one
+        self.clean = clean
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text: str):
+        """Add streamed text; returns the cleaned chunks completed by it"""
+        self.buffer += text or ""
+        chunks = []
+        start = 0
+        for match in _BOUNDARY_RE.finditer(self.buffer):
+            if match.group().startswith(".") and self._abbreviation(self.buffer[start:match.start()]):
+                continue
+            if match.end() - start < self.min_chars:
+                continue
+            chunk = self.clean(self.buffer[start:match.end()])
+            if chunk:
+                chunks.append(chunk)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return chunks
+
+    def flush(self):
+        """Whatever is left once the stream ends"""
+        chunk = self.clean(self.buffer)
+        self.buffer = ""
+        return [chunk] if chunk else []
+
+    def discard(self):
+        """Drop an unfinished sentence (the stream was cut off)"""
+        self.buffer = ""
+
+    @staticmethod
+    def _abbreviation(text: str) -> bool:
+        words = text.rsplit(None, 1)
+        return bool(words) and words[-1].lower().rstrip(".") in _ABBREVIATIONS
+
+
+def sse(event: str, data: dict) -> str:
+    """One server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
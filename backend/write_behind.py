@@ -0,0 +1,164 @@
+"""
+Write-behind queue for saved-session events (see session_log).
+
+Request threads hand their events to submit() and return; one writer thread persists them. The
+first event for a session opens a window of `window` seconds: anything else submitted for that
+session meanwhile joins the same write, and a newer cart or context state replaces the older
+one still waiting (chat messages and files are all kept). When the window is up the writer
+takes everything pending, appends one write per session and fsyncs each touched log once.
+
+At most max_pending sessions wait at a time. A submit for another session beyond that is
+refused and the caller writes synchronously, so a slow disk slows requests down instead of
+losing events. A batch that fails to write goes back in the queue and is retried after a
+backoff that doubles with each failure in a row, up to MAX_BACKOFF seconds. close() (at exit
+and on SIGTERM) writes whatever is still pending.
+"""
+import atexit
+import signal
+import threading
+import time
+
+import metrics
+
+# event types where only the latest state matters
+_SUPERSEDED = ("cart", "context")
+# longest wait between retries of a failing write, in seconds; also the failure log interval
+MAX_BACKOFF = 30.0
+
+
+def merge(queued, events):
+    """queued + events, dropping cart/context states that a newer one replaces"""
+    replaced = {e.get("type") for e in events} & set(_SUPERSEDED)
+    kept = [e for e in queued if e.get("type") not in replaced]
+    metrics.incr("session_persist_coalesced", len(queued) - len(kept))
+    return kept + list(events)
+
+
+class WriteBehind:
+    def __init__(self, write_batch, window: float = 0.2, max_pending: int = 1000):
+        # write_batch({sid: [events]}) persists and fsyncs one batch; it runs on the writer thread
+        self.write_batch = write_batch
+        self.window = window
+        self.max_pending = max_pending
+        self._pending = {}     # sid -> events waiting
+        self._since = None     # monotonic time the oldest pending event was submitted
+        self._delay = window   # wait before the next write: the window, or the backoff after a failure
+        self._failures = 0     # failed writes in a row
+        self._reported_at = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()   # one batch on disk at a time, in submit order
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, sid: str, events) -> bool:
+        """Queue events for sid; False when the queue is full or closed (write them yourself)"""
+        with self._cond:
+            if self._closed or (sid not in self._pending and len(self._pending) >= self.max_pending):
+                metrics.incr("session_persist_overflow")
+                return False
+            self._pending[sid] = merge(self._pending.get(sid, []), events)
+            if self._since is None:
+                self._since = time.monotonic()
+                self._cond.notify()
+            metrics.set_gauge("session_persist_queue_depth", len(self._pending))
+        return True
+
+    def write_now(self, sid: str, events):
+        """Synchronous write for a refused submit, ordered after the batch being written"""
+        with self._write_lock:
+            self.write_batch({sid: list(events)})
+
+    def _take(self):
+        # caller holds the condition
+        batch, since = self._pending, self._since
+        self._pending, self._since = {}, None
+        metrics.set_gauge("session_persist_queue_depth", 0)
+        return batch, since
+
+    def _write(self, batch: dict, since: float):
+        started = time.monotonic()
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            metrics.incr("session_persist_errors")
+            self._failures += 1
+            backoff = min(max(self.window, 0.05) * 2 ** self._failures, MAX_BACKOFF)
+            now = time.monotonic()
+            if self._reported_at is None or now - self._reported_at >= MAX_BACKOFF:
+                self._reported_at = now
+                print(f"Session writer failed on {len(batch)} sessions ({self._failures} failures in a row), "
+                      f"retrying in {backoff:g}s: {e}")
+            # back in the queue ahead of anything newer (replaying events already written is harmless)
+            with self._cond:
+                for sid, events in batch.items():
+                    self._pending[sid] = merge(events, self._pending.get(sid, []))
+                self._since, self._delay = now, backoff
+            return
+        if self._failures:
+            print(f"Session writer recovered after {self._failures} failed writes")
+            self._failures, self._reported_at, self._delay = 0, None, self.window
+        done = time.monotonic()
+        metrics.incr("session_persist_flushes")
+        metrics.incr("session_persist_sessions_written", len(batch))
+        # how long the write itself took, and how long the oldest event waited to be on disk
+        metrics.set_gauge("session_persist_flush_ms", round((done - started) * 1000, 1))
+        metrics.set_gauge("session_persist_lag_ms", round((done - since) * 1000, 1))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._since is None and not self._closed:
+                    self._cond.wait()
+                if self._closed and self._since is None:
+                    return
+                wait = self._since + self._delay - time.monotonic()
+            if wait > 0 and not self._closed:
+                time.sleep(wait)
+            with self._write_lock:
+                with self._cond:
+                    batch, since = self._take()
+                if batch:
+                    self._write(batch, since)
+
+    def flush(self):
+        """Write everything pending now, on the calling thread"""
+        with self._write_lock:
+            with self._cond:
+                batch, since = self._take()
+            if batch:
+                self._write(batch, since)
+
+    def close(self):
+        """Stop taking events and write what is left (safe to call more than once)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+
+def flush_on_shutdown(writer: WriteBehind):
+    """close() the writer at interpreter exit and on SIGTERM (then let the old handler act)"""
+    atexit.register(writer.close)
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def on_term(signum, frame):
+        print("🛑 SIGTERM — flushing pending session writes")
+        writer.close()
+        if previous == signal.SIG_IGN:
+            return
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise SystemExit(128 + signum)
+
+    try:
+        signal.signal(signal.SIGTERM, on_term)
+    except ValueError:   # not the main thread (imported by a worker thread): atexit still flushes
+        pass